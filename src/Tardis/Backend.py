@@ -171,6 +171,7 @@ class Backend:
         self.saveFull       = False
         self.lastCompleted  = None
         self.maxChain       = 0
+        self.pendingChunks  = {}
 
         self.sessionid = sessionid if sessionid else str(uuid.uuid1())
         self.idstr  = self.sessionid[0:13]   # Leading portion (ie, timestamp) of the UUID.  Sufficient for logging.
@@ -843,6 +844,36 @@ class Backend:
                 content.append(inoDev)
         return ({"message" : "ACKCLN", "done" : done, 'content' : content }, True)
 
+    def processCloneTree(self, message):
+        """ Clone entire directory trees, which the client has determined are unchanged since the previous backup set """
+        done = []
+        content = []
+        for d in message['trees']:
+            inoDev = (d['inode'], d['dev'])
+            info = self.db.getFileInfoByInode(inoDev, current=False)
+            if self.full or not info or not info['dir']:
+                content.append(inoDev)
+                continue
+
+            # Find all the directories in the tree in the previous set.  Make sure they match what the client
+            # thinks is there, if it knows, before cloning anything.
+            dirs = []
+            todo = [inoDev]
+            while todo:
+                dirNode = todo.pop()
+                dirs.append(dirNode)
+                todo.extend(self.db.getSubdirectories(dirNode, current=False))
+
+            if d.get('numdirs') is not None and len(dirs) != d['numdirs']:
+                self.logger.debug("Clone tree mismatch (%d %d): %d directories, expected %d", d['inode'], d['dev'], len(dirs), d['numdirs'])
+                content.append(inoDev)
+                continue
+
+            for dirNode in dirs:
+                self.db.cloneDir(dirNode)
+            done.append(inoDev)
+        return ({"message" : "ACKCLT", "done" : done, 'content' : content }, True)
+
 
     _sequenceNumber = 0
 
@@ -916,6 +947,89 @@ class Backend:
         #flush = True if bytesReceived > 1000000 else False
         return (None, False)
 
+    def processChunks(self, message):
+        """ Process the list of chunks making up a file.  Request any chunks which aren't already stored """
+        self.logger.debug("Processing chunk list for %s: %s -- %d chunks", message['inode'], message['checksum'], len(message['chunks']))
+        names = [c[0] for c in message['chunks']]
+        need = []
+        # If the whole file is already here, there's no need to look at the chunks.
+        if self.db.getChecksumInfo(message['checksum']):
+            have = set(names)
+        else:
+            have = self.db.getChunks(set(names))
+        for name in names:
+            if name not in have:
+                need.append(name)
+                have.add(name)
+
+        pending = {
+            'inode':     tuple(message['inode']),
+            'checksum':  message['checksum'],
+            'size':      message['size'],
+            'encrypted': message.get('encrypted', False),
+            'chunks':    names,
+            'need':      set(need)
+        }
+        if need:
+            self.pendingChunks[pending['inode']] = pending
+        else:
+            self.finishChunkedFile(pending)
+
+        response = {
+            "message": "ACKCHUNKS",
+            "status":  "OK",
+            "inode":   message['inode'],
+            "need":    need
+        }
+        return (response, False)
+
+    def processChunk(self, message):
+        """ Receive the data for a single chunk """
+        chunk = message['chunk']
+        chunks = self.cache.chunkStore()
+        tempName = os.path.join(self.tempdir, self.tempPrefix + str(self._sequenceNumber))
+        self._sequenceNumber += 1
+        output = open(tempName, 'wb')
+
+        (bytesReceived, status, size, _, compressed) = Util.receiveData(self.messenger, output)
+        output.close()
+        self.logger.debug("Chunk Received: %s %d %s %d %s", chunk, bytesReceived, status, size, compressed)
+
+        # Another file may have sent the same chunk since we asked for it.
+        if status == 'OK' and not self.db.getChunks([chunk]):
+            chunks.insert(chunk, tempName)
+            self.db.insertChunk(chunk, size, compressed=compressed, encrypted=message.get('encrypted', False), disksize=bytesReceived)
+        else:
+            os.remove(tempName)
+        self.statBytesReceived += bytesReceived
+
+        inode = tuple(message['inode'])
+        pending = self.pendingChunks.get(inode)
+        if pending:
+            pending['need'].discard(chunk)
+            if not pending['need']:
+                del self.pendingChunks[inode]
+                self.finishChunkedFile(pending)
+        return (None, False)
+
+    def finishChunkedFile(self, pending):
+        """ All the chunks for a file are present.  Record the file """
+        checksum = pending['checksum']
+        (inode, dev) = pending['inode']
+        try:
+            if self.db.getChecksumInfo(checksum) is None:
+                self.db.insertChecksum(checksum, pending['encrypted'], pending['size'], disksize=0, chunked=True)
+                self.db.setChunkRefs(checksum, pending['chunks'])
+            else:
+                self.logger.debug("Checksum %s already exists", checksum)
+            self.logger.debug("Setting checksum for inode %d to %s -- %d chunks", inode, checksum, len(pending['chunks']))
+            self.db.setChecksum(inode, dev, checksum)
+            self.statNewFiles += 1
+        except Exception as e:
+            self.logger.error("Could not insert chunked checksum %s info: %s", checksum, str(e))
+            if self.config.exceptions:
+                self.logger.exception(e)
+
     def processBatch(self, message):
         batch = message['batch']
         responses = []
@@ -960,6 +1074,9 @@ class Backend:
 
     def processDone(self, message):
         self.done = True
+        if self.pendingChunks:
+            self.logger.warning("%d chunked files not completed", len(self.pendingChunks))
+            self.pendingChunks = {}
         response = {
             'message': 'ACKDONE'
         }
@@ -1012,10 +1129,16 @@ class Backend:
             (response, flush) = self.processDelta(message)
         elif messageType == "CON":
             (response, flush) = self.processContent(message)
+        elif messageType == "CHUNKS":
+            (response, flush) = self.processChunks(message)
+        elif messageType == "CHUNK":
+            (response, flush) = self.processChunk(message)
         elif messageType == "CKS":
             (response, flush) = self.processChecksum(message)
         elif messageType == "CLN":
             (response, flush) = self.processClone(message)
+        elif messageType == "CLT":
+            (response, flush) = self.processCloneTree(message)
         elif messageType == "BATCH":
             (response, flush) = self.processBatch(message)
         elif messageType == "PRG":
@@ -1399,6 +1522,7 @@ class Backend:
                 "status": "OK",
                 "sessionid": self.sessionid,
                 "prevDate": str(self.db.prevBackupDate),
+                "prevSession": self.db.prevBackupSession,
                 "new": newBackup,
                 "name": serverName if serverName else name,
                 "clientid": str(self.db.clientId)
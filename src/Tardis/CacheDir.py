@@ -47,6 +47,7 @@ class CacheDirDoesNotExist(Exception):
 PARTSIZE    = "partsize"
 PARTS       = "parts"
 CONFIGFILE  = ".cachedir"
+CHUNKDIR    = "chunks"
 
 class CacheDir:
     def __init__(self, root, parts=2, partsize=2, create=True, user=None, group=None, skipFile=Defaults.getDefault("TARDIS_SKIP")):
@@ -54,7 +55,8 @@ class CacheDir:
         self.user  = user if user else -1
         self.group = group if group else -1
         self.chown = user or group
-
+        self.create = create
+        self._chunks = None
 
         if not os.path.isdir(self.root):
             if create:
@@ -176,6 +178,21 @@ class CacheDir:
         except OSError:
             return False
 
+    def chunkStore(self):
+        """ Get the store for chunks of files backed up with content defined chunking """
+        if self._chunks is None:
+            self._chunks = ChunkStore(self)
+        return self._chunks
+
+    def openChunk(self, name, mode):
+        return self.chunkStore().open(name, mode)
+
+class ChunkStore(CacheDir):
+    """ Chunks are kept in their own tree, under the cache directory, as a chunk can have the same name as a checksum """
+    def __init__(self, cache):
+        super().__init__(os.path.join(cache.root, CHUNKDIR), parts=cache.parts, partsize=cache.partsize, create=cache.create,
+                         user=cache.user if cache.chown else None, group=cache.group if cache.chown else None, skipFile=None)
+
 if __name__ == "__main__":
     test = "abcdefghijklmnop"
     testPath = os.path.join("cache", socket.gethostname())
@@ -0,0 +1,125 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Tardis: A Backup System
+# Copyright 2013-2020, Eric Koldinger, All Rights Reserved.
+# kolding@washington.edu
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import hashlib
+import sys
+import time
+
+# Content defined chunking, based on FastCDC (Xia et al, USENIX ATC 2016).
+# A gear hash is rolled across the data, and a chunk boundary is declared where the
+# top bits of the hash are all zero.  Boundaries depend only on the local content, so
+# an insertion or deletion only changes the chunks around it, and identical runs of data
+# in different files (or different versions of the same file) produce identical chunks.
+#
+# Normalized chunking is used:  a harder mask is used before the average size, and an easier
+# one after, which tightens the chunk size distribution around the average.  Nothing is
+# examined below the minimum size, which is where most of the speed comes from.
+
+_mask64 = 0xFFFFFFFFFFFFFFFF
+
+# Fixed gear table.  Must never change, or chunk boundaries (and thus deduplication) will shift.
+_gear = tuple(int.from_bytes(hashlib.md5(b'Tardis Gear %d' % i).digest()[:8], 'little') for i in range(256))
+
+def _mask(bits):
+    # Use the high bits of the hash, as they depend on the most bytes in the window.
+    return ((1 << bits) - 1) << (64 - bits)
+
+class Chunker:
+    def __init__(self, minSize=2048, avgSize=8192, maxSize=65536, readSize=1024 * 1024):
+        if not minSize < avgSize < maxSize:
+            raise ValueError("Chunk sizes must satisfy min < avg < max: {} {} {}".format(minSize, avgSize, maxSize))
+        self.minSize  = minSize
+        self.avgSize  = avgSize
+        self.maxSize  = maxSize
+        self.readSize = max(readSize, maxSize)
+        bits = avgSize.bit_length() - 1
+        self.maskS = _mask(bits + 1)
+        self.maskL = _mask(bits - 1)
+
+    def cut(self, buf, start=0, end=None):
+        """ Find the length of the chunk beginning at start in buf, looking no further than end """
+        if end is None:
+            end = len(buf)
+        n = end - start
+        if n <= self.minSize:
+            return n
+        normal = start + min(self.avgSize, n)
+        end = start + min(self.maxSize, n)
+        gear = _gear
+        fp = 0
+
+        i = start + self.minSize
+        mask = self.maskS
+        while i < normal:
+            fp = ((fp << 1) + gear[buf[i]]) & _mask64
+            i += 1
+            if not fp & mask:
+                return i - start
+        mask = self.maskL
+        while i < end:
+            fp = ((fp << 1) + gear[buf[i]]) & _mask64
+            i += 1
+            if not fp & mask:
+                return i - start
+        return end - start
+
+    def chunks(self, stream):
+        """ Generate (offset, data) tuples for each chunk in the stream """
+        buf = b''
+        pos = 0
+        offset = 0
+        eof = False
+        while True:
+            if not eof and len(buf) - pos < self.maxSize:
+                data = stream.read(self.readSize)
+                if data:
+                    buf = buf[pos:] + data
+                    pos = 0
+                else:
+                    eof = True
+            if pos >= len(buf):
+                break
+            length = self.cut(buf, pos)
+            yield offset, buf[pos:pos + length]
+            pos += length
+            offset += length
+
+if __name__ == "__main__":
+    # Print the chunking speed and the chunk size distribution for some files
+    c = Chunker()
+    for name in sys.argv[1:]:
+        with open(name, 'rb') as f:
+            start = time.time()
+            sizes = [len(x) for _, x in c.chunks(f)]
+            end = time.time()
+        total = sum(sizes)
+        if sizes:
+            print("{}: {} bytes, {} chunks, avg {:.0f} min {} max {} -- {:.2f} MB/s".format(name, total, len(sizes), total / len(sizes), min(sizes), max(sizes), total / (end - start) / 1000000))
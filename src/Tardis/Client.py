@@ -60,6 +60,8 @@ import traceback
 import threading
 import cProfile
 import socket
+import struct
+import queue
 import concurrent.futures
 
 from binascii import hexlify
@@ -71,7 +73,7 @@ import srp
 import colorlog
 from pathmatch import wildmatch
 from functools import reduce
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import Tardis
 import Tardis.TardisCrypto as TardisCrypto
@@ -85,6 +87,9 @@ import Tardis.StatusBar as StatusBar
 import Tardis.Backend as Backend
 #import Tardis.Throttler as Throttler
 import Tardis.ThreadedScheduler as ThreadedScheduler
+import Tardis.ClientCache as ClientCache
+import Tardis.Watcher as Watcher
+import Tardis.Chunker as Chunker
 
 features = Tardis.check_features()
 support_xattr = 'xattr' in features
@@ -118,6 +123,7 @@ configDefaults = {
     'Force':                str(False),
     'Full':                 str(False),
     'Timeout':              str(300.0),
+    'InFlight':             str(4),
     'Password':             None,
     'PasswordFile':         Defaults.getDefault('TARDIS_PWFILE'),
     'PasswordProg':         None,
@@ -126,6 +132,8 @@ configDefaults = {
     'SendClientConfig':     Defaults.getDefault('TARDIS_SEND_CONFIG'),
     'CompressData':         'none',
     'CompressMin':          str(4096),
+    'Chunking':             str(False),
+    'ChunkMin':             str(1024 * 1024),
     'NoCompressFile':       Defaults.getDefault('TARDIS_NOCOMPRESS'),
     'NoCompress':           '',
     'CompressMsgs':         'none',
@@ -145,6 +153,10 @@ configDefaults = {
     'Stats':                str(False),
     'Report':               'none',
     'Directories':          '.',
+    'ScanThreads':          str(4),
+    'StatCache':            str(False),
+    'ChangeJournal':        '',
+    'CacheDir':             Defaults.getDefault('TARDIS_CACHE_DIR'),
     
     # Backend parameters
     'Formats'               : 'Monthly-%Y-%m, Weekly-%Y-%U, Daily-%Y-%m-%d',
@@ -192,6 +204,10 @@ config              = None
 
 cloneDirs           = []
 cloneContents       = {}
+cloneTrees          = []
+cloneTreeContents   = {}
+rewalkTrees         = []                            # Cloned trees the server couldn't find, which need to be sent in full
+stagedDirs          = {}                            # Client cache entries waiting for the server to acknowledge a clone
 batchMsgs           = []
 metaCache           = Util.bidict()                 # A cache of metadata.  Since many files can have the same metadata, we check that
                                                     # that we haven't sent it yet.
@@ -208,6 +224,10 @@ srpUsr              = None
 sessionid           = None
 clientId            = None
 lastTimestamp       = None
+prevSession         = None
+clientCache         = None
+changeJournal       = None
+chunker             = None
 backupName          = None
 newBackup           = None
 filenameKey         = None
@@ -222,46 +242,161 @@ contentKey          = None
 # Example: If you have 100 files, and 99 of them are already backed up (ie, one new), backed would be 100, but new would be 1.
 # dataSent is the compressed and encrypted size of the files (or deltas) sent in this run, but dataBacked is the total size of
 # the files.
-stats = { 'dirs' : 0, 'files' : 0, 'links' : 0, 'backed' : 0, 'dataSent': 0, 'dataBacked': 0 , 'new': 0, 'delta': 0, 'gone': 0, 'denied': 0 }
+stats = { 'dirs' : 0, 'files' : 0, 'links' : 0, 'backed' : 0, 'dataSent': 0, 'dataBacked': 0 , 'new': 0, 'delta': 0, 'gone': 0, 'denied': 0, 'cached': 0, 'unvisited': 0,
+          'chunks': 0, 'chunksSent': 0 }
 
 report = {}
 
 
 
+_modes = {}
+
 class InodeEntry:
-    def __init__(self):
-        self.paths = []
-        self.numEntries = 0
-        self.finfo = None
+    """
+    Everything we need to remember about a file until the server's told us what to do with it.
+    Just the mode and size (available as entry['mode'] and entry['size'], like the full file info), and the path,
+    split into the directory, which is shared between all the files in the directory, and the name.
+    Extra paths for hard links, which are rare, go into a list.
+    """
+    __slots__ = ('mode', 'size', 'dir', 'name', 'more')
+
+    def __init__(self, mode, size, dir, name):
+        self.setInfo(mode, size)
+        self.dir = dir
+        self.name = name
+        self.more = None
+
+    def setInfo(self, mode, size):
+        # Only a handful of different modes ever show up.  Share the objects.
+        self.mode = _modes.setdefault(mode, mode)
+        self.size = size
+
+    def __getitem__(self, key):
+        if key == 'mode':
+            return self.mode
+        elif key == 'size':
+            return self.size
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ('mode', 'size')
+
+    def numPaths(self):
+        return 1 + (len(self.more) if self.more else 0)
+
+    def getPath(self, num):
+        if num == 0:
+            return os.path.join(self.dir, self.name)
+        return self.more[num - 1]
 
 class InodeDB:
+    """
+    Files which have been sent to the server, but haven't been acknowledged yet.
+    Keyed by (inode, device), stored as one dictionary of inodes per device, to avoid creating a tuple for every file.
+    """
     def __init__(self):
-        self.db = defaultdict(InodeEntry)
+        self.db = defaultdict(dict)
+        self.lastDir = None
+        self.count = 0
 
     def insert(self, inode, finfo, path):
-        entry = self.db[inode]
-        entry.numEntries += 1
-        entry.paths.append(path)
-        entry.finfo = finfo
+        (ino, dev) = inode
+        inodes = self.db[dev]
+        entry = inodes.get(ino)
+        if entry is None:
+            (dirname, name) = os.path.split(path)
+            # Files get inserted a directory at a time, so share the directory name with the last file, if we can.
+            # Share the name with the file info too.
+            if dirname == self.lastDir:
+                dirname = self.lastDir
+            else:
+                self.lastDir = dirname
+            if name == finfo['name']:
+                name = finfo['name']
+            entry = InodeEntry(finfo['mode'], finfo['size'], dirname, name)
+            inodes[ino] = entry
+            self.count += 1
+        else:
+            entry.setInfo(finfo['mode'], finfo['size'])
+            if entry.more is None:
+                entry.more = []
+            entry.more.append(path)
 
     def get(self, inode, num=0):
-        if not inode in self.db:
+        (ino, dev) = inode
+        entry = self.db.get(dev, {}).get(ino)
+        if entry is None:
             return (None, None)
-        entry = self.db[inode]
-        if num >= len(entry.paths):
-            return (entry.finfo, None)
-        return (entry.finfo, entry.paths[num])
+        if num >= entry.numPaths():
+            return (entry, None)
+        return (entry, entry.getPath(num))
 
     def delete(self, inode, path=None):
-        if inode in self.db:
-            entry = self.db[inode]
-            entry.numEntries -= 1
-            if entry.numEntries == 0:
-                self.db.pop(inode)
-            if path:
-                entry.paths.remove(path)
-            else:
-                entry.paths.pop(0)
+        (ino, dev) = inode
+        inodes = self.db.get(dev)
+        if not inodes or ino not in inodes:
+            return
+        entry = inodes[ino]
+        if not entry.more:
+            del inodes[ino]
+            self.count -= 1
+        elif path and path in entry.more:
+            entry.more.remove(path)
+        else:
+            # Remove the first path.  Promote the next one.
+            (entry.dir, entry.name) = os.path.split(entry.more.pop(0))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, inode):
+        (ino, dev) = inode
+        return ino in self.db.get(dev, {})
+
+class PackedFiles:
+    """
+    A list of file infos, packed down as small as we can get them, for hanging onto while waiting for the server.
+    The numeric fields are packed into a single bytes object, the names kept in a tuple, and the (rare) extended
+    attribute and ACL hashes in a dictionary by index.
+    """
+    _fields = ('inode', 'dev', 'nlinks', 'size', 'mtime', 'ctime', 'atime', 'mode', 'uid', 'gid', 'dir', 'link')
+    _struct = struct.Struct('<QQIqqqqIII??')
+    __slots__ = ('names', 'data', 'meta')
+
+    def __init__(self, files):
+        pack = self._struct.pack
+        fields = self._fields
+        self.names = tuple(f['name'] for f in files)
+        self.data = b''.join(pack(*[f[x] for x in fields]) for f in files)
+        self.meta = None
+        for (i, f) in enumerate(files):
+            if 'xattr' in f or 'acl' in f:
+                if self.meta is None:
+                    self.meta = {}
+                self.meta[i] = (f.get('xattr'), f.get('acl'))
+
+    def __len__(self):
+        return len(self.names)
+
+    def inodes(self):
+        """ Generate the (inode, device) pairs of the files, without unpacking everything """
+        for values in self._struct.iter_unpack(self.data):
+            yield (values[0], values[1])
+
+    def unpack(self):
+        """ Regenerate the list of file info dictionaries """
+        files = []
+        for (i, values) in enumerate(self._struct.iter_unpack(self.data)):
+            f = dict(zip(self._fields, values))
+            f['name'] = self.names[i]
+            if self.meta and i in self.meta:
+                (xattr, acl) = self.meta[i]
+                if xattr:
+                    f['xattr'] = xattr
+                if acl:
+                    f['acl'] = acl
+            files.append(f)
+        return files
 
 inodeDB             = InodeDB()
 dirHashes           = {}
@@ -706,14 +841,22 @@ def sendContent(inode, reportType):
                         logger.debug("Not compressing %s.  Type %s", pathname, mimeType)
                         compress = False
                 makeSig = crypt.encrypting() or args.signature
-                sendMessage(message)
-                #batchMessage(message, batch=False, flush=True, response=False)
-                (size, checksum, sig) = Util.sendData(conn.sender, data,
-                                                      encrypt, hasher=crypt.getHash(),
-                                                      chunksize=args.chunksize,
-                                                      compress=compress,
-                                                      signature=makeSig,
-                                                      stats=stats)
+                sent = None
+                if chunker and stat.S_ISREG(mode) and filesize >= args.chunkmin:
+                    sent = sendChunkedContent(inode, data, pathname, compress, makeSig)
+                    if sent is None:
+                        data.seek(0)
+                if sent:
+                    (size, checksum, sig) = sent
+                else:
+                    sendMessage(message)
+                    #batchMessage(message, batch=False, flush=True, response=False)
+                    (size, checksum, sig) = Util.sendData(conn.sender, data,
+                                                          encrypt, hasher=crypt.getHash(),
+                                                          chunksize=args.chunksize,
+                                                          compress=compress,
+                                                          signature=makeSig,
+                                                          stats=stats)
 
                 if sig:
                     sig.seek(0)
@@ -746,6 +889,66 @@ def sendContent(inode, reportType):
             args.loginodes.write(f"SendContent: No inode entry for {inode}\n".encode('utf8'))
         exceptionLogger.log(e)
 
+def hashChunk(chunk):
+    h = crypt.getHash()
+    h.update(chunk)
+    return h.hexdigest()
+
+def sendChunkedContent(inode, data, pathname, compress, makeSig):
+    """
+    Split a file into content defined chunks, and send the list of chunks.  Then send any of the chunks the server
+    doesn't already have.  Returns the same (size, checksum, signature) as Util.sendData, or None if the file changed
+    while it was being sent, in which case the file should be sent in full.
+    """
+    stream = CompressedBuffer.BufferedReader(data, hasher=crypt.getHash(), signature=makeSig)
+    chunks = []
+    offsets = {}
+    for offset, chunk in chunker.chunks(stream):
+        name = hashChunk(chunk)
+        chunks.append((name, len(chunk)))
+        offsets.setdefault(name, (offset, len(chunk)))
+
+    checksum = stream.checksum()
+    size = stream.size()
+    message = {
+        "message":   "CHUNKS",
+        "inode":     inode,
+        "checksum":  checksum,
+        "size":      size,
+        "chunks":    chunks,
+        "encrypted": crypt.encrypting()
+    }
+    setMessageID(message)
+    response = sendAndReceive(message)
+    checkMessage(response, 'ACKCHUNKS')
+
+    need = response['need']
+    logger.debug("Chunked %s: %d chunks, %d needed", Util.shortPath(pathname), len(chunks), len(need))
+    Util.accumulateStat(stats, 'chunks', len(chunks))
+    sig = stream.signatureFile()
+    for name in need:
+        (offset, length) = offsets[name]
+        data.seek(offset)
+        chunk = data.read(length)
+        # Make sure the file hasn't changed underneath us since the chunks were computed
+        if len(chunk) != length or hashChunk(chunk) != name:
+            logger.warning("%s changed while being backed up.  Sending full content", pathname)
+            if sig:
+                sig.close()
+            return None
+        encrypt, iv = makeEncryptor()
+        message = {
+            "message":   "CHUNK",
+            "inode":     inode,
+            "chunk":     name,
+            "encrypted": True if iv else False
+        }
+        sendMessage(message)
+        Util.sendData(conn.sender, io.BytesIO(chunk), encrypt, chunksize=args.chunksize,
+                      compress=compress if length > args.mincompsize else None, stats=stats)
+        Util.accumulateStat(stats, 'chunksSent')
+    return (size, checksum, sig)
+
 def handleAckMeta(message):
     checkMessage(message, 'ACKMETA')
     content = message.setdefault('content', {})
@@ -838,7 +1041,25 @@ def handleAckDir(message):
     allRefresh += refresh
     allDone    += done
 
+_pushing = False
+
 def pushFiles():
+    """
+    Send everything the server has asked for.  Responses handled while we're sending (for instance, draining the
+    response window before asking for signatures) only add to the lists, and are picked up here, rather than
+    pushing the same files again recursively.
+    """
+    global _pushing
+    if _pushing:
+        return
+    _pushing = True
+    try:
+        while allContent or allRefresh or allDelta or allDone or allCkSum:
+            _pushFiles()
+    finally:
+        _pushing = False
+
+def _pushFiles():
     global allContent, allDelta, allCkSum, allRefresh, allDone
     logger.debug("Pushing files")
     # If checksum content in NOT specified, send the data for each file
@@ -850,8 +1071,10 @@ def pushFiles():
         args.loginodes.write(f"AllCkSum:   {len(allCkSum)}: {str(allCkSum)}\n".encode('utf8'))
 
     processed = []
+    content, refresh, delta, done = allContent, allRefresh, allDelta, allDone
+    allContent, allRefresh, allDelta, allDone = [], [], [], []
 
-    for i in [tuple(x) for x in allContent]:
+    for i in [tuple(x) for x in content]:
         try:
             if logger.isEnabledFor(logging.FILES):
                 logFileInfo(i, 'N')
@@ -861,7 +1084,7 @@ def pushFiles():
             logger.error("Unable to backup %s: %s", str(i), str(e))
 
 
-    for i in [tuple(x) for x in allRefresh]:
+    for i in [tuple(x) for x in refresh]:
         if logger.isEnabledFor(logging.FILES):
             logFileInfo(i, 'R')
         try:
@@ -872,10 +1095,10 @@ def pushFiles():
 
     # If there are any delta files requested, ask for them
     signatures = None
-    if not args.full and len(allDelta) != 0:
-        signatures = prefetchSigFiles(allDelta)
+    if not args.full and len(delta) != 0:
+        signatures = prefetchSigFiles(delta)
 
-    for i in [tuple(x) for x in allDelta]:
+    for i in [tuple(x) for x in delta]:
         # If doing a full backup, send the full file, else just a delta.
         try:
             if args.full:
@@ -895,12 +1118,8 @@ def pushFiles():
     # clear it out
     for i in processed:
         inodeDB.delete(i)
-    for i in [tuple(x) for x in allDone]:
+    for i in [tuple(x) for x in done]:
         inodeDB.delete(i)
-    allRefresh = []
-    allContent = []
-    allDelta   = []
-    allDone    = []
 
     # If checksum content is specified, concatenate the checksums and content requests, and handle checksums
     # for all of them.
@@ -930,13 +1149,15 @@ def addMeta(meta):
         newmeta.append(digest)
         return digest
 
-def mkFileInfo(f):
+def readFileInfo(f):
+    """
+    Gather the raw stat, extended attribute, and ACL information for a directory entry.
+    Only does I/O, no bookkeeping, so it's safe to run on a scanner thread.
+    Returns None if the file should be skipped entirely.
+    """
     pathname = f.path
     s = f.stat(follow_symlinks=False)
 
-    # Cleanup any bogus characters
-    name = f.name.encode('utf8', 'backslashreplace').decode('utf8')
-
     mode = s.st_mode
 
     # If we don't want to even create dir entries for things we can't access, just return None 
@@ -944,24 +1165,10 @@ def mkFileInfo(f):
     if args.skipNoAccess and (not Util.checkPermission(s.st_uid, s.st_gid, mode)):
         return None
 
-    if stat.S_ISREG(mode) or stat.S_ISDIR(mode) or stat.S_ISLNK(mode):
-        #name = crypt.encryptFilename(name)
-        finfo =  {
-            'name':   name,
-            'inode':  s.st_ino,
-            'dir':    stat.S_ISDIR(mode),
-            'link':   stat.S_ISLNK(mode),
-            'nlinks': s.st_nlink,
-            'size':   s.st_size,
-            'mtime':  int(s.st_mtime),              # We strip these down to the integer value beacuse FP conversions on the back side can get confused.
-            'ctime':  int(s.st_ctime),
-            'atime':  int(s.st_atime),
-            'mode':   s.st_mode,
-            'uid':    s.st_uid,
-            'gid':    s.st_gid,
-            'dev':    s.st_dev
-            }
+    attr_string = None
+    acl_string = None
 
+    if stat.S_ISREG(mode) or stat.S_ISDIR(mode) or stat.S_ISLNK(mode):
         if support_xattr and args.xattr:
             try:
                 attrs = xattr.xattr(pathname, options=xattr.XATTR_NOFOLLOW)
@@ -971,8 +1178,6 @@ def mkFileInfo(f):
                     # We base64 encode the data chunk, as it's often binary
                     # Ugly, but unfortunately necessary
                     attr_string = json.dumps(dict([(str(x[0]), str(base64.b64encode(x[1]), 'utf8')) for x in sorted(attrs.items())]))
-                    cks = addMeta(attr_string)
-                    finfo['xattr'] = cks
             except:
                 logger.warning("Could not read extended attributes from %s.   Ignoring", pathname)
 
@@ -981,12 +1186,55 @@ def mkFileInfo(f):
             # Definitely an issue
             try:
                 if posix1e.has_extended(pathname):
-                    acl = posix1e.ACL(file=pathname)
-                    cks = addMeta(str(acl))
-                    finfo['acl'] = cks
+                    acl_string = str(posix1e.ACL(file=pathname))
             except:
                 logger.warning("Could not read ACL's from %s.   Ignoring", pathname.encode('utf8', 'backslashreplace').decode('utf8'))
 
+    return (s, attr_string, acl_string)
+
+def mkFileInfo(f, info=None):
+    """
+    Build the file info for a directory entry, and register it in the inode DB.
+    info is the result of readFileInfo(), if it's already been gathered (on a scanner thread, for instance).
+    """
+    if info is None:
+        info = readFileInfo(f)
+        if info is None:
+            return None
+
+    pathname = f.path
+    (s, attr_string, acl_string) = info
+
+    # Cleanup any bogus characters
+    name = f.name
+    if not name.isascii():
+        name = name.encode('utf8', 'backslashreplace').decode('utf8')
+
+    mode = s.st_mode
+
+    if stat.S_ISREG(mode) or stat.S_ISDIR(mode) or stat.S_ISLNK(mode):
+        #name = crypt.encryptFilename(name)
+        finfo =  {
+            'name':   name,
+            'inode':  s.st_ino,
+            'dir':    stat.S_ISDIR(mode),
+            'link':   stat.S_ISLNK(mode),
+            'nlinks': s.st_nlink,
+            'size':   s.st_size,
+            'mtime':  int(s.st_mtime),              # We strip these down to the integer value beacuse FP conversions on the back side can get confused.
+            'ctime':  int(s.st_ctime),
+            'atime':  int(s.st_atime),
+            'mode':   s.st_mode,
+            'uid':    s.st_uid,
+            'gid':    s.st_gid,
+            'dev':    s.st_dev
+            }
+
+        if attr_string:
+            finfo['xattr'] = addMeta(attr_string)
+        if acl_string:
+            finfo['acl'] = addMeta(acl_string)
+
         # Insert into the inode DB
         inode = (s.st_ino, s.st_dev)
         if args.loginodes:
@@ -999,14 +1247,13 @@ def mkFileInfo(f):
         finfo = None
     return finfo
 
-def getDirContents(dirname, dirstat, excludes=set()):
-    """ Read a directory, load any new exclusions, delete the excluded files, and return a list
-        of the files, a list of sub directories, and the new list of excluded patterns """
-
-    #logger.debug("Processing directory : %s", dir)
-    Util.accumulateStat(stats, 'dirs')
-    device = dirstat.st_dev
-
+def readDirectory(dirname, excludes):
+    """
+    Read a directory, load any new exclusions, and gather the info for each file which isn't excluded.
+    Returns a list of (entry, info) tuples, where info is either the result of readFileInfo() or the exception raised
+    reading it, the new set of exclusion patterns, and any error reading the directory itself.
+    Does no bookkeeping, so can be run on a scanner thread.
+    """
     # Process an exclude file which will be passed on down to the receivers
     newExcludes = loadExcludeFile(os.path.join(dirname, excludeFile))
     newExcludes = newExcludes.union(excludes)
@@ -1015,38 +1262,96 @@ def getDirContents(dirname, dirstat, excludes=set()):
     # Add a list of local files to exclude.  These won't get passed to lower directories
     localExcludes = excludes.union(loadExcludeFile(os.path.join(dirname, args.localexcludefile)))
 
-    files = []
-    subdirs = []
-
+    entries = []
+    error = None
     try:
         for f in filelist(dirname, localExcludes):
             try:
-                fInfo = mkFileInfo(f)
-                if fInfo and (args.crossdev or device == fInfo['dev']):
-                    mode = fInfo["mode"]
-                    if stat.S_ISLNK(mode):
-                        Util.accumulateStat(stats, 'links')
-                    elif stat.S_ISREG(mode):
-                        Util.accumulateStat(stats, 'files')
-                        Util.accumulateStat(stats, 'backed', fInfo['size'])
-
-                    if stat.S_ISDIR(mode):
-                        sub = os.path.join(dirname, f)
-                        if sub in excludeDirs:
-                            logger.debug("%s excluded.  Skipping", sub)
-                            continue
-                        else:
-                            subdirs.append(sub)
-
-                    files.append(fInfo)
-            except (IOError, OSError) as e:
-                logger.error("Error processing %s: %s", os.path.join(dirname, f), str(e))
+                entries.append((f, readFileInfo(f)))
             except Exception as e:
-                ## Is this necessary?  Fold into above?
-                logger.error("Error processing %s: %s", os.path.join(dirname, f), str(e))
-                exceptionLogger.log(e)
+                entries.append((f, e))
     except (IOError, OSError) as e:
-        logger.error("Error reading directory %s: %s" ,dir, str(e))
+        error = e
+
+    return (entries, excludes, error)
+
+class DirScanner:
+    """
+    Read directories on a pool of threads, ahead of the tree walk.
+    recurseTree still consumes the results in its own (sorted, depth first) order, so the
+    messages sent to the server are the same as when reading in line.
+    """
+    def __init__(self, threads, lookahead):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='Scanner')
+        self.lookahead = lookahead
+        self.pending = {}
+
+    def prefetch(self, dirs, excludes):
+        """ Start reading the next few directories in dirs.  Directories already being read are skipped """
+        for d in dirs[:self.lookahead]:
+            if d not in self.pending:
+                self.pending[d] = self.pool.submit(readDirectory, d, excludes)
+
+    def take(self, dirname):
+        """ Remove and return the pending read for a directory, if any """
+        return self.pending.pop(dirname, None)
+
+    def shutdown(self):
+        for f in self.pending.values():
+            f.cancel()
+        self.pending = {}
+        self.pool.shutdown(wait=True)
+
+dirScanner = None
+
+def getDirContents(dirname, dirstat, excludes=set(), scan=None):
+    """ Read a directory, load any new exclusions, delete the excluded files, and return a list
+        of the files, a list of sub directories, and the new list of excluded patterns.
+        If scan is set, it's a pending readDirectory() call from the DirScanner """
+
+    #logger.debug("Processing directory : %s", dir)
+    Util.accumulateStat(stats, 'dirs')
+    device = dirstat.st_dev
+
+    if scan:
+        (entries, excludes, error) = scan.result()
+    else:
+        (entries, excludes, error) = readDirectory(dirname, excludes)
+
+    files = []
+    subdirs = []
+
+    for (f, info) in entries:
+        try:
+            if isinstance(info, Exception):
+                raise info
+            fInfo = mkFileInfo(f, info) if info else None
+            if fInfo and (args.crossdev or device == fInfo['dev']):
+                mode = fInfo["mode"]
+                if stat.S_ISLNK(mode):
+                    Util.accumulateStat(stats, 'links')
+                elif stat.S_ISREG(mode):
+                    Util.accumulateStat(stats, 'files')
+                    Util.accumulateStat(stats, 'backed', fInfo['size'])
+
+                if stat.S_ISDIR(mode):
+                    sub = os.path.join(dirname, f)
+                    if sub in excludeDirs:
+                        logger.debug("%s excluded.  Skipping", sub)
+                        continue
+                    else:
+                        subdirs.append(sub)
+
+                files.append(fInfo)
+        except (IOError, OSError) as e:
+            logger.error("Error processing %s: %s", os.path.join(dirname, f), str(e))
+        except Exception as e:
+            ## Is this necessary?  Fold into above?
+            logger.error("Error processing %s: %s", os.path.join(dirname, f), str(e))
+            exceptionLogger.log(e)
+
+    if error:
+        logger.error("Error reading directory %s: %s", dirname, str(error))
 
     return (files, subdirs, excludes)
 
@@ -1063,10 +1368,11 @@ def handleAckClone(message):
     # Purge out what hasn't changed
     for i in done:
         inode = tuple(i)
+        if inode in stagedDirs:
+            clientCache.setDirs([stagedDirs.pop(inode)], str(sessionid))
         if inode in cloneContents:
             (path, files) = cloneContents[inode]
-            for f in files:
-                key = (f['inode'], f['dev'])
+            for key in files.inodes():
                 inodeDB.delete(key)
             del cloneContents[inode]
         else:
@@ -1077,16 +1383,68 @@ def handleAckClone(message):
     # Process the directories that have changed
     for i in content:
         finfo = tuple(i)
+        stagedDirs.pop(finfo, None)
         if finfo in cloneContents:
             (path, files) = cloneContents[finfo]
             if logdirs:
                 logger.log(logging.DIRS, "[R]: %s", Util.shortPath(path))
-            sendDirChunks(path, finfo, files)
+            sendDirChunks(path, finfo, files.unpack())
             del cloneContents[finfo]
         else:
             logger.error("Unable to locate info for %s", str(finfo))
 
 
+def handleAckCloneTree(message):
+    checkMessage(message, 'ACKCLT')
+    if verbosity > 2:
+        logger.debug("Processing ACKCLT: Up-to-date: %d Not Found: %d", len(message['done']), len(message['content']))
+
+    content = message.setdefault('content', {})
+    done    = message.setdefault('done', {})
+
+    for i in done:
+        inode = tuple(i)
+        if inode in cloneTreeContents:
+            (path, top, depth, excludes, dirs) = cloneTreeContents.pop(inode)
+            if clientCache:
+                clientCache.touchDirs(dirs, str(sessionid))
+        else:
+            logger.error("Unable to locate info for %s", inode)
+
+    # The server couldn't clone these.  Save them to be walked again, and sent in full.
+    for i in content:
+        inode = tuple(i)
+        if inode in cloneTreeContents:
+            (path, top, depth, excludes, dirs) = cloneTreeContents.pop(inode)
+            logger.debug("Unable to clone tree %s.  Rescanning", path)
+            rewalkTrees.append((path, top, depth, excludes))
+        else:
+            logger.error("Unable to locate info for %s", inode)
+
+def makeCloneTreeMessage():
+    global cloneTrees
+    message = {
+        'message': 'CLT',
+        'trees': cloneTrees
+    }
+    cloneTrees = []
+    return message
+
+def sendCloneTrees():
+    message = makeCloneTreeMessage()
+    setMessageID(message)
+    response = sendAndReceive(message)
+    checkMessage(response, 'ACKCLT')
+    handleAckCloneTree(response)
+
+def flushCloneTrees():
+    if cloneTrees:
+        logger.debug("Flushing %d clone trees", len(cloneTrees))
+        if args.batchdirs:
+            batchMessage(makeCloneTreeMessage())
+        else:
+            sendCloneTrees()
+
 def makeCloneMessage():
     global cloneDirs
     message = {
@@ -1118,7 +1476,8 @@ def sendBatchMsgs():
         # If there's only one, don't batch it up, just send it.
         msg = batchMsgs[0]
         batchMsgs = []
-        response = sendAndReceive(msg)
+        _batchStartTime = None
+        sendPipelined(msg)
     else:
         logger.debug("Sending %d batch messages", len(batchMsgs))
         message = {
@@ -1126,31 +1485,32 @@ def sendBatchMsgs():
             'batchsize': batchSize,
             'batch'    : batchMsgs
         }
-        msgId = setMessageID(message)
+        setMessageID(message)
         logger.debug("BATCH Starting. %s commands", len(batchMsgs))
+        msgIds = [x['msgid'] for x in batchMsgs]
 
         # Clear out the batch messages before sending, or you can get into an awkward loop.
         # if it's not cleared out, the sendAndReceive can make a set of calls that will
         # cause another message to be added to the batch (in pushFiles) which will cause the batch to
         # be reprocessed.
         batchMsgs = []
-
-        response = sendAndReceive(message)
-        checkMessage(response, 'ACKBTCH')
-        respSize = len(response['responses'])
-        logger.debug("Got response.  %d responses", respSize)
-        if respSize != batchSize:
-            logger.error("Response size does not equal batch size: ID: %d B: %d R: %d", msgId, batchSize, respSize)
-            if logger.isEnabledFor(logging.DEBUG):
-                msgs = set([x['msgid'] for x in batchMsgs])
-                resps = set([x['respid'] for x in response['responses']])
-                diffs1 = msgs.difference(resps)
-                logger.debug("Missing Messages: %s", str(list(diffs1)))
-        logger.debug("BATCH Ending.")
-
-    _batchStartTime = None
-    # Process the response messages
-    handleResponse(response)
+        _batchStartTime = None
+
+        # Process the response messages
+        sendPipelined(message, msgIds)
+
+def checkBatchResponse(msgId, msgIds, response):
+    checkMessage(response, 'ACKBTCH')
+    respSize = len(response['responses'])
+    logger.debug("Got response.  %d responses", respSize)
+    if respSize != len(msgIds):
+        logger.error("Response size does not equal batch size: ID: %d B: %d R: %d", msgId, len(msgIds), respSize)
+        if logger.isEnabledFor(logging.DEBUG):
+            msgs = set(msgIds)
+            resps = set([x['respid'] for x in response['responses']])
+            diffs1 = msgs.difference(resps)
+            logger.debug("Missing Messages: %s", str(list(diffs1)))
+    logger.debug("BATCH Ending.")
 
 def flushBatchMsgs():
     if len(batchMsgs):
@@ -1191,6 +1551,8 @@ def sendDirChunks(path, inode, files):
             for i in chunk:
                 i['name'] = crypt.encryptFilename(i['name'])
 
+        # Each slice gets its own message, as earlier ones may still be waiting to be processed
+        message = dict(message)
         message["files"] = chunk
         message["last"]  = (x + args.dirslice > len(files))
         if verbosity > 3:
@@ -1223,33 +1585,101 @@ def setProgress(mode, name):
         statusBar.setValue('mode', mode)
         statusBar.setTrailer(name)
 
-processedDirs = set()
+def sendDirectory(dir, top, s, files, h, cacheRow=None):
+    """ Send a directory to the server, either as a clone of the previous version, or as a set of directory entries, or some of each.
+        cacheRow is the client cache entry to record if the server agrees that the directory is unchanged. """
+    dirHashes[(s.st_ino, s.st_dev)] = h
 
-def recurseTree(dir, top, depth=0, excludes=[]):
-    """ Process a directory, send any contents along, and then dive down into subdirectories and repeat. """
-    global dirHashes
+    # Figure out which files to clone, and which to update
+    if files and args.clones:
+        if len(files) > args.clonethreshold:
+            newFiles = [f for f in files if max(f['ctime'], f['mtime']) >= lastTimestamp]
+            oldFiles = [f for f in files if max(f['ctime'], f['mtime']) < lastTimestamp]
+        else:
+            maxTime = max([max(x["ctime"], x["mtime"]) for x in files])
+            if maxTime < lastTimestamp:
+                oldFiles = files
+                newFiles = []
+            else:
+                newFiles = files
+                oldFiles = []
+    else:
+        newFiles = files
+        oldFiles = []
 
+    if newFiles:
+        # There are new and (maybe) old files.
+        # First, save the hash.
+
+        # Purge out any meta data that's been accumulated
+        if newmeta:
+            batchMessage(makeMetaMessage())
+
+        if oldFiles:
+            # There are oldfiles.  Hash them.
+            if logger.isEnabledFor(logging.DIRS):
+                logger.log(logging.DIRS, "[A]: %s", Util.shortPath(dir))
+            cloneDir(s.st_ino, s.st_dev, oldFiles, dir)
+        else:
+            if logger.isEnabledFor(logging.DIRS):
+                logger.log(logging.DIRS, "[B]: %s", Util.shortPath(dir))
+        sendDirChunks(os.path.relpath(dir, top), (s.st_ino, s.st_dev), newFiles)
+
+    else:
+        # everything is old
+        if logger.isEnabledFor(logging.DIRS):
+            logger.log(logging.DIRS, "[C]: %s", Util.shortPath(dir))
+        # Only a complete clone confirms that the server has exactly what we have
+        if cacheRow:
+            stagedDirs[(s.st_ino, s.st_dev)] = cacheRow
+        cloneDir(s.st_ino, s.st_dev, oldFiles, dir, info=h)
+
+_digestFields = ('name', 'inode', 'dev', 'mode', 'nlinks', 'size', 'mtime', 'ctime', 'uid', 'gid', 'xattr', 'acl')
+
+def statDigest(files):
+    """ Generate a digest of all the stat info of the files in a directory, so we can tell if anything in it has changed """
+    m = hashlib.md5()
+    for f in sorted(files, key=lambda x: x['name']):
+        m.update(bytes(repr(tuple(f.get(x) for x in _digestFields)), 'utf8', 'backslashreplace'))
+    return m.digest()
+
+def checkClientCache(cacheRow):
+    """ Determine if a directory is unchanged since the server last confirmed it, in the previous backup set """
+    cached = clientCache.getDir(cacheRow[0], cacheRow[1])
+    return cached is not None and cached[6] == prevSession and tuple(cached[:6]) == cacheRow[2:]
+
+processedDirs = set()
+
+def recurseTree(dir, top, depth=0, excludes=[], useCache=True, useJournal=True):
+    """ Process a directory, send any contents along, and then dive down into subdirectories and repeat.
+        If the client cache says the entire tree is unchanged, nothing is sent, and the list of (inode, device) pairs
+        of all the directories in the tree is returned.  It's up to the caller to have the server clone it.
+        Otherwise returns None.
+        If useJournal is set, and there's a change journal, only subdirectories the journal lists as changed are visited. """
     newdepth = 0
     if depth > 0:
         newdepth = depth - 1
 
     setProgress("Dir:", dir)
 
+    # Pick up the read of this directory, if the scanner has started it
+    scan = dirScanner.take(dir) if dirScanner else None
+
     try:
         s = os.lstat(dir)
         if not stat.S_ISDIR(s.st_mode):
-            return
+            return None
 
         # Mark that we've processed it before attempting to determine if we actually should
         processedDirs.add(dir)
 
         if dir in excludeDirs:
             logger.debug("%s excluded.  Skipping", dir)
-            return
+            return None
 
         if os.path.lexists(os.path.join(dir, args.skipfile)):
             logger.debug("Skip file found.  Skipping %s", dir)
-            return
+            return None
 
         if args.skipcaches and os.path.lexists(os.path.join(dir, 'CACHEDIR.TAG')):
             logger.debug("CACHEDIR.TAG file found.  Analyzing")
@@ -1258,65 +1688,78 @@ def recurseTree(dir, top, depth=0, excludes=[]):
                     line = f.readline()
                     if line.startswith('Signature: 8a477f597d28d172789f06886806bc55'):
                         logger.debug("Valid CACHEDIR.TAG file found.  Skipping %s", dir)
-                        return
+                        return None
             except Exception as e:
                 logger.warning("Could not read %s.  Backing up directory %s", os.path.join(dir, 'CACHEDIR.TAG'), dir)
                 exceptionLogger.log(e)
 
-        (files, subdirs, subexcludes) = getDirContents(dir, s, excludes)
-
-        h = Util.hashDir(crypt, files)
-        #logger.debug("Dir: %s (%d, %d): Hash: %s Size: %d.", Util.shortPath(dir), s.st_ino, s.st_dev, h[0], h[1])
-        dirHashes[(s.st_ino, s.st_dev)] = h
+        (files, subdirs, subexcludes) = getDirContents(dir, s, excludes, scan)
 
-        # Figure out which files to clone, and which to update
-        if files and args.clones:
-            if len(files) > args.clonethreshold:
-                newFiles = [f for f in files if max(f['ctime'], f['mtime']) >= lastTimestamp]
-                oldFiles = [f for f in files if max(f['ctime'], f['mtime']) < lastTimestamp]
+        # Only go into the subdirectories that the change journal says have changed.  Clone the rest.
+        subdirs = sorted(subdirs)
+        unvisited = []
+        if changeJournal and useJournal:
+            if changeJournal.isChangedTree(dir):
+                useJournal = False
             else:
-                maxTime = max([max(x["ctime"], x["mtime"]) for x in files])
-                if maxTime < lastTimestamp:
-                    oldFiles = files
-                    newFiles = []
-                else:
-                    newFiles = files
-                    oldFiles = []
-        else:
-            newFiles = files
-            oldFiles = []
+                (subdirs, unvisited) = changeJournal.split(subdirs)
 
-        if newFiles:
-            # There are new and (maybe) old files.
-            # First, save the hash.
+        # Get the scanner going on the subdirectories while we talk to the server about this one
+        if dirScanner and depth != 1:
+            dirScanner.prefetch(subdirs, subexcludes)
 
-            # Purge out any meta data that's been accumulated
-            if newmeta:
-                batchMessage(makeMetaMessage())
+        h = Util.hashDir(crypt, files)
+        #logger.debug("Dir: %s (%d, %d): Hash: %s Size: %d.", Util.shortPath(dir), s.st_ino, s.st_dev, h[0], h[1])
 
-            if oldFiles:
-                # There are oldfiles.  Hash them.
-                if logger.isEnabledFor(logging.DIRS):
-                    logger.log(logging.DIRS, "[A]: %s", Util.shortPath(dir))
-                cloneDir(s.st_ino, s.st_dev, oldFiles, dir)
-            else:
-                if logger.isEnabledFor(logging.DIRS):
-                    logger.log(logging.DIRS, "[B]: %s", Util.shortPath(dir))
-            sendDirChunks(os.path.relpath(dir, top), (s.st_ino, s.st_dev), newFiles)
+        # Check if this directory is unchanged since the last backup.  If so, hold off on sending it until we know
+        # if the entire tree below it is unchanged as well.
+        cacheRow = None
+        clean = False
+        if clientCache:
+            cacheRow = (s.st_ino, s.st_dev, int(s.st_mtime), int(s.st_ctime), s.st_size, s.st_nlink, h[0], statDigest(files))
+            clean = useCache and depth != 1 and checkClientCache(cacheRow)
 
-        else:
-            # everything is old
-            if logger.isEnabledFor(logging.DIRS):
-                logger.log(logging.DIRS, "[C]: %s", Util.shortPath(dir))
-            cloneDir(s.st_ino, s.st_dev, oldFiles, dir, info=h)
+        if not clean:
+            sendDirectory(dir, top, s, files, h, cacheRow)
 
         # Make sure we're not at maximum depth
         if depth != 1:
             # Purge out the lists.  Allow garbage collection to take place.  These can get largish.
-            files = oldFiles = newFiles = None
+            if not clean:
+                files = None
             # Process the sub directories
-            for subdir in sorted(subdirs):
-                recurseTree(subdir, top, newdepth, subexcludes)
+            subtrees = []
+            changed = False
+            for subdir in unvisited:
+                cloneUnvisited(subdir, top, newdepth, subexcludes)
+                changed = True
+            for i, subdir in enumerate(subdirs):
+                if dirScanner:
+                    dirScanner.prefetch(subdirs[i:], subexcludes)
+                tree = recurseTree(subdir, top, newdepth, subexcludes, useCache, useJournal)
+                if tree is None:
+                    changed = True
+                else:
+                    subtrees.append((subdir, tree))
+
+            if clean and not changed:
+                # Nothing in this tree has changed.  Pass it up to our parent
+                Util.accumulateStat(stats, 'cached')
+                for f in files:
+                    inodeDB.delete((f['inode'], f['dev']))
+                tree = [(s.st_ino, s.st_dev)]
+                for (_, t) in subtrees:
+                    tree.extend(t)
+                return tree
+
+            if clean:
+                # Something below here has changed, so this directory needs to go after all.
+                sendDirectory(dir, top, s, files, h, cacheRow)
+
+            # Have the server clone any unchanged subtrees.
+            for (subdir, tree) in subtrees:
+                cloneTree(subdir, top, newdepth, subexcludes, tree)
+        return None
     except ExitRecursionException:
         raise
     except OSError as e:
@@ -1332,6 +1775,35 @@ def recurseTree(dir, top, depth=0, excludes=[]):
         exceptionLogger.log(e)
         raise ExitRecursionException(e)
 
+def cloneTree(path, top, depth, excludes, dirs, complete=True):
+    """ Send a clone tree message, asking the server to clone an entire unchanged tree of directories.
+        dirs is the list of (inode, device) pairs of all the directories in the tree, the root first.
+        If complete is false, only the root is known, and the server can't check the number of directories. """
+    (inode, device) = dirs[0]
+    if logger.isEnabledFor(logging.DIRS):
+        logger.log(logging.DIRS, "[T]: %s", Util.shortPath(path))
+    message = {'inode': inode, 'dev': device, 'numdirs': len(dirs) if complete else None}
+    cloneTrees.append(message)
+    cloneTreeContents[(inode, device)] = (path, top, depth, excludes, dirs)
+    if len(cloneTrees) >= args.clones:
+        flushCloneTrees()
+
+def cloneUnvisited(path, top, depth, excludes):
+    """ Clone a directory tree which the change journal says is unchanged, without looking inside it """
+    try:
+        s = os.lstat(path)
+        if stat.S_ISDIR(s.st_mode):
+            Util.accumulateStat(stats, 'unvisited')
+            processedDirs.add(path)
+            cloneTree(path, top, depth, excludes, [(s.st_ino, s.st_dev)], complete=False)
+    except OSError as e:
+        logger.error("Error handling directory: %s: %s", path, str(e))
+
+def journalOptions(directories):
+    """ Generate a hash of the options which determine what gets backed up.  If these change, the change journal can't be used. """
+    options = [sorted(directories), sorted(p.pattern for p in globalExcludes), sorted(excludeDirs), args.crossdev, args.maxdepth,
+               args.skipcaches, args.excludefilename, args.localexcludefile, args.skipfile, args.skipNoAccess]
+    return hashlib.md5(bytes(json.dumps(options), 'utf8')).hexdigest()
 
 def cloneDir(inode, device, files, path, info=None):
     """ Send a clone message, containing the hash of the filenames, and the number of files """
@@ -1342,7 +1814,8 @@ def cloneDir(inode, device, files, path, info=None):
 
     message = {'inode':  inode, 'dev': device, 'numfiles': s, 'cksum': h}
     cloneDirs.append(message)
-    cloneContents[(inode, device)] = (path, files)
+    # Hang onto the files, in case the server decides it needs them after all.  Packed, these can be a lot of files
+    cloneContents[(inode, device)] = (path, PackedFiles(files))
     if len(cloneDirs) >= args.clones:
         flushClones()
 
@@ -1449,8 +1922,93 @@ def receiveMessage():
 
 waittime = 0
 
+class ResponseWindow:
+    """
+    Keep several messages outstanding to the server, rather than waiting for each response before sending the next.
+    The server processes messages, and sends responses, strictly in order, so responses are matched to the oldest
+    outstanding message, and handled in the order the messages were sent.
+    Responses are read on a separate thread, so the server never blocks writing responses while we're still sending.
+    The reader only reads as many messages as there are outstanding, so anything which talks to the server
+    synchronously (signatures, etc) must drain the window first.  sendAndReceive does this.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.outstanding = deque()
+        self.requests = queue.SimpleQueue()
+        self.responses = queue.SimpleQueue()
+        self.latency = 0.0
+        self.reader = threading.Thread(target=self.run, name='Responses', daemon=True)
+        self.reader.start()
+
+    def run(self):
+        while self.requests.get():
+            try:
+                response = receiveMessage()
+            except BaseException as e:
+                response = e
+            self.responses.put((response, time.time()))
+
+    def send(self, message, batch=None):
+        """ Send a message, and note that we're waiting for its response.  batch is the list of message ID's in a batch """
+        sendMessage(message)
+        self.outstanding.append((message['msgid'], batch, time.time()))
+        self.requests.put(True)
+
+    def full(self):
+        return len(self.outstanding) >= self.size
+
+    def ready(self):
+        return not self.responses.empty()
+
+    def next(self):
+        """ Wait for and return the response to the oldest outstanding message """
+        global waittime
+        s = time.time()
+        (response, received) = self.responses.get()
+        waittime += time.time() - s
+        (msgid, batch, sent) = self.outstanding.popleft()
+        self.latency += received - sent
+        if isinstance(response, BaseException):
+            raise response
+        if response.get('respid') != msgid:
+            raise ProtocolError("Expected response to message {}, received response to {}".format(msgid, response.get('respid')))
+        if batch is not None:
+            checkBatchResponse(msgid, batch, response)
+        return response
+
+    def saved(self):
+        """ How much longer we would have waited sending one message at a time """
+        return max(self.latency - waittime, 0)
+
+    def close(self):
+        self.requests.put(False)
+
+responseWindow = None
+
+def sendPipelined(message, batch=None):
+    """ Send a message, and handle the response when it arrives.  Without a response window, that's right now. """
+    if responseWindow:
+        # Handle anything that's already here, and make room in the window if it's full
+        while responseWindow.outstanding and (responseWindow.full() or responseWindow.ready()):
+            handleResponse(responseWindow.next())
+        responseWindow.send(message, batch)
+    else:
+        response = sendAndReceive(message)
+        if batch is not None:
+            checkBatchResponse(message['msgid'], batch, response)
+        handleResponse(response)
+
+def drainResponses():
+    """ Wait for, and handle, all the outstanding responses.  Returns True if there were any """
+    drained = False
+    while responseWindow and responseWindow.outstanding:
+        handleResponse(responseWindow.next())
+        drained = True
+    return drained
+
 def sendAndReceive(message):
     global waittime
+    drainResponses()
     s = time.time()
     sendMessage(message)
     response = receiveMessage()
@@ -1497,6 +2055,8 @@ def handleResponse(response, doPush=True, pause=0):
             handleAckDir(response)
         elif msgtype == 'ACKCLN':
             handleAckClone(response)
+        elif msgtype == 'ACKCLT':
+            handleAckCloneTree(response)
         elif msgtype == 'ACKPRG':
             pass
         elif msgtype == 'ACKSUM':
@@ -1555,13 +2115,15 @@ def batchMessage(message, batch=True, flush=False, response=True):
 
     if flush or not batch or len(batchMsgs) >= args.batchsize or (now - _batchStartTime) > args.batchduration:
         flushClones()
+        flushCloneTrees()
         flushBatchMsgs()
     if not batch:
         if response:
-            respmessage = sendAndReceive(message)
-            handleResponse(respmessage)
+            sendPipelined(message)
         else:
             sendMessage(message)
+    if flush:
+        drainResponses()
 
 def sendDirEntry(parent, device, files):
     # send a fake root directory
@@ -1694,7 +2256,7 @@ def doSrpAuthentication(response):
     
 
 def startBackup(name, priority, client, autoname, force, full=False, create=False, password=None, version=Tardis.__versionstring__):
-    global sessionid, clientId, lastTimestamp, backupName, newBackup, filenameKey, contentKey, crypt
+    global sessionid, clientId, lastTimestamp, prevSession, backupName, newBackup, filenameKey, contentKey, crypt
 
     # Create a BACKUP message
     message = {
@@ -1727,6 +2289,7 @@ def startBackup(name, priority, client, autoname, force, full=False, create=Fals
     sessionid      = uuid.UUID(resp['sessionid'])
     clientId       = uuid.UUID(resp['clientid'])
     lastTimestamp  = float(resp['prevDate'])
+    prevSession    = resp.get('prevSession')
     backupName     = resp['name']
     newBackup      = resp['new']
     if 'filenameKey' in resp:
@@ -1872,6 +2435,12 @@ def processCommandLine():
     parser.add_argument('--compress-data',  '-Z',   dest='compress', const='zlib', default=c.get(t, 'CompressData'), nargs='?', choices=CompressedBuffer.getCompressors(),
                         help='Compress files.  ' + _def)
     parser.add_argument('--compress-min',           dest='mincompsize', type=int, default=c.getint(t, 'CompressMin'),   help='Minimum size to compress.  ' + _def)
+    parser.add_argument('--chunking',               dest='chunking', action=Util.StoreBoolean, default=c.getboolean(t, 'Chunking'),
+                        help='Split large new files into content defined chunks, and only send chunks the server doesn\'t already have.  ' + _def)
+    parser.add_argument('--chunk-min',              dest='chunkmin', type=int, default=c.getint(t, 'ChunkMin'),
+                        help='Minimum file size to chunk.  ' + _def)
+    parser.add_argument('--chunk-avg',              dest='chunkavg', type=int, default=64 * 1024,
+                        help=_d('Average chunk size.  Chunks will be between 1/4 and 4 times this size.  ' + _def))
     parser.add_argument('--nocompress-types',       dest='nocompressfile', default=splitList(c.get(t, 'NoCompressFile')), action='append',
                         help='File containing a list of MIME types to not compress.  ' + _def)
     parser.add_argument('--nocompress', '-z',       dest='nocompress', default=splitList(c.get(t, 'NoCompress')), action='append',
@@ -1885,6 +2454,18 @@ def processCommandLine():
     parser.add_argument('--priority',           dest='priority', type=int, default=None,                                help='Set the priority of this backup')
     parser.add_argument('--maxdepth', '-d',     dest='maxdepth', type=int, default=0,                                   help='Maximum depth to search')
     parser.add_argument('--crossdevice',        dest='crossdev', action=Util.StoreBoolean, default=False,               help='Cross devices. ' + _def)
+    parser.add_argument('--scan-threads',       dest='scanthreads', type=int, default=c.getint(t, 'ScanThreads'),
+                        help='Number of threads reading directories ahead of the backup.  0 to read directories in line.  ' + _def)
+    parser.add_argument('--scan-ahead',         dest='scanahead', type=int, default=16,
+                        help=_d('Maximum number of subdirectories of each directory to read ahead.  ' + _def))
+    parser.add_argument('--stat-cache',         dest='statcache', action=Util.StoreBoolean, default=c.getboolean(t, 'StatCache'),
+                        help='Keep a local cache of directory state, and have the server clone unchanged directory trees without sending them.  ' + _def)
+    parser.add_argument('--cache-dir',          dest='cachedir', default=c.get(t, 'CacheDir'),
+                        help='Directory to keep local client caches in.  ' + _def)
+    parser.add_argument('--change-journal',     dest='changejournal', default=c.get(t, 'ChangeJournal'),
+                        help='Change journal file written by a watcher.  If the watcher has been running since the last backup, only changed directories are visited.  ' + _def)
+    parser.add_argument('--watch',              dest='watch', action='store_true', default=False,
+                        help='Run as a watcher, recording changed directories into the change journal, rather than running a backup')
 
     parser.add_argument('--basepath',           dest='basepath', default='full', choices=['none', 'common', 'full'],    help='Select style of root path handling ' + _def)
 
@@ -1920,6 +2501,8 @@ def processCommandLine():
     comgrp.add_argument('--batchdir', '-B',         dest='batchdirs', type=int, default=16,             help=_d('Maximum size of small dirs to send.  0 to disable batching.  ' + _def))
     comgrp.add_argument('--batchsize',              dest='batchsize', type=int, default=100,            help=_d('Maximum number of small dirs to batch together.  ' + _def))
     comgrp.add_argument('--batchduration',          dest='batchduration', type=float, default=30.0,     help=_d('Maximum time to hold a batch open.  ' + _def))
+    comgrp.add_argument('--inflight',               dest='inflight', type=int, default=c.getint(t, 'InFlight'),
+                        help='Maximum number of messages outstanding to the server at once.  1 to wait for each response.  ' + _def)
     comgrp.add_argument('--ckbatchsize',            dest='cksumbatch', type=int, default=100,           help=_d('Maximum number of checksums to handle in a single message.  ' + _def))
     comgrp.add_argument('--chunksize',              dest='chunksize', type=int, default=256*1024,       help=_d('Chunk size for sending data.  ' + _def))
     comgrp.add_argument('--dirslice',               dest='dirslice', type=int, default=128*1024,        help=_d('Maximum number of directory entries per message.  ' + _def))
@@ -2080,6 +2663,12 @@ def printStats(starttime, endtime):
     logger.log(logging.STATS, "Runtime:          {}".format(duration))
     logger.log(logging.STATS, "Backed Up:        Dirs: {:,}  Files: {:,}  Links: {:,}  Total Size: {:}".format(stats['dirs'], stats['files'], stats['links'], Util.fmtSize(stats['backed'])))
     logger.log(logging.STATS, "Files Sent:       Full: {:,}  Deltas: {:,}".format(stats['new'], stats['delta']))
+    if clientCache:
+        logger.log(logging.STATS, "Unchanged Dirs:   {:,}".format(stats['cached']))
+    if changeJournal:
+        logger.log(logging.STATS, "Unvisited Trees:  {:,}".format(stats['unvisited']))
+    if chunker:
+        logger.log(logging.STATS, "Chunks:           Total: {:,}  Sent: {:,}".format(stats['chunks'], stats['chunksSent']))
     logger.log(logging.STATS, "Data Sent:        Sent: {:}   Backed: {:}".format(Util.fmtSize(stats['dataSent']), Util.fmtSize(stats['dataBacked'])))
     logger.log(logging.STATS, "Messages:         Sent: {:,} ({:}) Received: {:,} ({:})".format(connstats['messagesSent'], Util.fmtSize(connstats['bytesSent']), connstats['messagesRecvd'], Util.fmtSize(connstats['bytesRecvd'])))
     logger.log(logging.STATS, "Data Sent:        {:}".format(Util.fmtSize(stats['dataSent'])))
@@ -2089,6 +2678,8 @@ def printStats(starttime, endtime):
 
 
     logger.log(logging.STATS, "Wait Times:   {:}".format(str(datetime.timedelta(0, waittime))))
+    if responseWindow:
+        logger.log(logging.STATS, "Wait Saved:   {:}".format(str(datetime.timedelta(0, responseWindow.saved()))))
     logger.log(logging.STATS, "Sending Time: {:}".format(str(datetime.timedelta(0, Util._transmissionTime))))
 
 def pickMode():
@@ -2227,7 +2818,7 @@ def runBackend(jobname):
     return conn, backend, backendThread
 
 def main():
-    global starttime, args, config, conn, verbosity, crypt, noCompTypes, srpUsr, statusBar
+    global starttime, args, config, conn, verbosity, crypt, noCompTypes, srpUsr, statusBar, dirScanner, clientCache, changeJournal, chunker, responseWindow
     # Read the command line arguments.
     commandLine = ' '.join(sys.argv) + '\n'
     (args, config, jobname) = processCommandLine()
@@ -2248,7 +2839,7 @@ def main():
         # Get the actual names we're going to use
         (server, port, client) = parseServerInfo(args)
 
-        if args.exclusive:
+        if args.exclusive and not args.watch:
             lockRun(server, port, client)
 
         # Figure out the name and the priority of this backupset
@@ -2305,6 +2896,9 @@ def main():
         noCompTypes = set(types)
         logger.debug("Types to ignore: %s", sorted(noCompTypes))
 
+        if args.chunking:
+            chunker = Chunker.Chunker(args.chunkavg // 4, args.chunkavg, args.chunkavg * 4)
+
         # Calculate the base directories
         directories = list(itertools.chain.from_iterable(list(map(glob.glob, list(map(Util.fullPath, args.directories))))))
         if args.basepath == 'common':
@@ -2335,6 +2929,13 @@ def main():
         exceptionLogger.log(e)
         sys.exit(1)
 
+    # Run the watcher instead of a backup
+    if args.watch:
+        if not args.changejournal:
+            logger.critical("--watch requires --change-journal")
+            sys.exit(1)
+        return Watcher.watch(directories, Util.fullPath(args.changejournal), args.crossdev, excludeDirs, args.excludefilename)
+
     # determine mode:
     localmode = pickMode()
 
@@ -2401,6 +3002,34 @@ def main():
         }
         batchMessage(message)
 
+    # Open the client cache.  On a full backup everything gets sent anyhow, so don't bother.
+    if args.statcache and args.clones and not args.full:
+        try:
+            clientCache = ClientCache.ClientCache(os.path.join(Util.fullPath(args.cachedir), str(clientId) + '.db'), str(clientId))
+        except Exception as e:
+            logger.warning("Unable to open client cache in %s: %s", args.cachedir, e)
+            exceptionLogger.log(e)
+
+    # Load up the change journal, and record that this backup has started
+    if args.changejournal:
+        try:
+            journal = Watcher.ChangeJournal(Util.fullPath(args.changejournal))
+            options = journalOptions(directories)
+            journal.mark(str(sessionid), options)
+            if args.clones and not args.full and journal.load(prevSession, options, directories):
+                changeJournal = journal
+        except Exception as e:
+            logger.warning("Unable to use change journal %s: %s", args.changejournal, e)
+            exceptionLogger.log(e)
+
+    # Start the directory scanner threads
+    if args.scanthreads > 0:
+        dirScanner = DirScanner(args.scanthreads, args.scanahead)
+
+    # And the response window
+    if args.inflight > 1:
+        responseWindow = ResponseWindow(args.inflight)
+
     # Now, do the actual work here.
     exc = None
     try:
@@ -2418,15 +3047,33 @@ def main():
                 f = mkFileInfo(FakeDirEntry(root, name))
                 sendDirEntry(0, 0, [f])
             # And run the directory
-            recurseTree(directory, root, depth=args.maxdepth, excludes=globalExcludes)
+            if changeJournal and not changeJournal.wanted(directory):
+                cloneUnvisited(directory, root, args.maxdepth, globalExcludes)
+                continue
+            tree = recurseTree(directory, root, depth=args.maxdepth, excludes=globalExcludes)
+            if tree:
+                cloneTree(directory, root, args.maxdepth, globalExcludes, tree)
 
         # If any metadata, clone or batch requests still lying around, send them now
         if newmeta:
             batchMessage(makeMetaMessage())
         flushClones()
-        while flushBatchMsgs():
+        flushCloneTrees()
+        while flushBatchMsgs() or drainResponses():
             pass
 
+        # Send any trees the server couldn't clone, in full
+        if rewalkTrees:
+            logger.debug("Resending %d directory trees", len(rewalkTrees))
+            while rewalkTrees:
+                (path, top, depth, excludes) = rewalkTrees.pop(0)
+                recurseTree(path, top, depth, excludes, useCache=False, useJournal=False)
+            if newmeta:
+                batchMessage(makeMetaMessage())
+            flushClones()
+            while flushBatchMsgs() or drainResponses():
+                pass
+
         # Send a purge command, if requested.
         if args.purge:
             if args.purgetime:
@@ -2438,6 +3085,15 @@ def main():
         }
         batchMessage(message, batch=False, flush=True)
 
+        # Everything made it.  Anything in the client cache that wasn't confirmed this time is stale.
+        if clientCache:
+            clientCache.purgeDirs(str(sessionid))
+        if args.changejournal:
+            try:
+                Watcher.ChangeJournal(Util.fullPath(args.changejournal)).done(str(sessionid))
+            except Exception as e:
+                logger.warning("Unable to update change journal %s: %s", args.changejournal, e)
+
     except KeyboardInterrupt as e:
         logger.warning("Backup Interupted")
         exc = "Backup Interrupted"
@@ -2453,6 +3109,12 @@ def main():
         exceptionLogger.log(e)
     finally:
         setProgress("Finishing backup", "")
+        if dirScanner:
+            dirScanner.shutdown()
+        if responseWindow:
+            responseWindow.close()
+        if clientCache:
+            clientCache.close()
         conn.close(exc)
         if localmode:
             conn.send(Exception("Terminate connection"))
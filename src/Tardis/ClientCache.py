@@ -0,0 +1,107 @@
+# vi: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Tardis: A Backup System
+# Copyright 2013-2020, Eric Koldinger, All Rights Reserved.
+# kolding@washington.edu
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import sqlite3
+import logging
+
+_cacheVersion = 1
+
+class ClientCache:
+    """
+    Local, client side, cache of the state of the last backup.
+    Stored in a small sqlite database, one per client (identified by the client ID the server hands back).
+
+    The Dirs table holds the stat info of each directory which the server has acknowledged as unchanged, along
+    with a digest of the stat info of all the entries in it, and the session it was acknowledged in.
+    A row is only trustworthy if that session is the previous backup set the server is cloning from.
+    """
+    def __init__(self, path, identity):
+        self.logger = logging.getLogger('ClientCache')
+        self.path = path
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, 0o700)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous=false")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS Config (Key TEXT PRIMARY KEY, Value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS Dirs ("
+                          "Inode INTEGER, Device INTEGER, Mtime INTEGER, Ctime INTEGER, Size INTEGER, NLinks INTEGER, "
+                          "Hash TEXT, Digest BLOB, Session TEXT, "
+                          "PRIMARY KEY (Inode, Device)) WITHOUT ROWID")
+
+        # If the cache was built for a different client (or an older format), throw it away.
+        if self.getConfigValue('Identity') != identity or self.getConfigValue('Version') != str(_cacheVersion):
+            self.logger.debug("Resetting client cache %s for %s", path, identity)
+            self.conn.execute("DELETE FROM Dirs")
+            self.setConfigValue('Identity', identity)
+            self.setConfigValue('Version', str(_cacheVersion))
+        self.conn.commit()
+
+    def getConfigValue(self, key, default=None):
+        row = self.conn.execute("SELECT Value FROM Config WHERE Key = :key", {"key": key}).fetchone()
+        return row[0] if row else default
+
+    def setConfigValue(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO Config (Key, Value) VALUES(:key, :value)", {"key": key, "value": value})
+
+    def getDir(self, inode, device):
+        """ Return the (mtime, ctime, size, nlinks, hash, digest, session) recorded for a directory, or None """
+        return self.conn.execute("SELECT Mtime, Ctime, Size, NLinks, Hash, Digest, Session FROM Dirs "
+                                 "WHERE Inode = :inode AND Device = :device",
+                                 {"inode": inode, "device": device}).fetchone()
+
+    def setDirs(self, rows, session):
+        """ Record directories as acknowledged in session.  Rows are (inode, device, mtime, ctime, size, nlinks, hash, digest) """
+        self.conn.executemany("INSERT OR REPLACE INTO Dirs (Inode, Device, Mtime, Ctime, Size, NLinks, Hash, Digest, Session) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (row + (session,) for row in rows))
+
+    def touchDirs(self, keys, session):
+        """ Mark already recorded directories, (inode, device) pairs, as acknowledged in session """
+        self.conn.executemany("UPDATE Dirs SET Session = ? WHERE Inode = ? AND Device = ?",
+                              ((session, inode, device) for (inode, device) in keys))
+
+    def purgeDirs(self, session):
+        """ Remove all the directories which weren't acknowledged in session """
+        c = self.conn.execute("DELETE FROM Dirs WHERE Session != :session", {"session": session})
+        self.logger.debug("Purged %d stale directories from client cache", c.rowcount)
+        return c.rowcount
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
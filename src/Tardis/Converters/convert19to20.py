@@ -0,0 +1,83 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Tardis: A Backup System
+# Copyright 2013-2020, Eric Koldinger, All Rights Reserved.
+# kolding@washington.edu
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import sqlite3
+import sys
+import os.path
+import logging
+
+from . import convertutils
+
+version = 19
+
+def upgrade(conn, logger):
+    convertutils.checkVersion(conn, version, logger)
+
+    conn.execute("ALTER TABLE CheckSums ADD COLUMN Chunked INTEGER DEFAULT 0")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Chunks (
+        Chunk       TEXT UNIQUE NOT NULL,
+        ChunkId     INTEGER PRIMARY KEY AUTOINCREMENT,
+        Size        INTEGER,
+        DiskSize    INTEGER,
+        Compressed  TEXT,
+        Encrypted   INTEGER,
+        Added       INTEGER
+    );
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ChunkRefs (
+        ChecksumId  INTEGER NOT NULL,
+        Seq         INTEGER NOT NULL,
+        ChunkId     INTEGER NOT NULL,
+        PRIMARY KEY(ChecksumId, Seq),
+        FOREIGN KEY(ChecksumId)  REFERENCES CheckSums(ChecksumId),
+        FOREIGN KEY(ChunkId)     REFERENCES Chunks(ChunkId)
+    );
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS ChunkRefIndex ON ChunkRefs(ChunkId)")
+
+    convertutils.updateVersion(conn, version, logger)
+    conn.commit()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    logger = logging.getLogger('')
+
+    if len(sys.argv) > 1:
+        db = sys.argv[1]
+    else:
+        db = "tardis.db"
+
+    conn = sqlite3.connect(db)
+    upgrade(conn, logger)
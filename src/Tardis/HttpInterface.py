@@ -415,6 +415,23 @@ def getFileData(checksum):
     except:
         abort(404)
 
+@app.route('/getChunkList/<checksum>')
+def getChunkList(checksum):
+    db = getDB()
+    return createResponse(list(map(makeDict, db.getChunkList(checksum))))
+
+@app.route('/getChunkData/<chunk>')
+def getChunkData(chunk):
+    host = session['host']
+    cache = caches[host]
+    try:
+        chunkfile = cache.openChunk(chunk, "rb")
+        resp = Response(_stream(chunkfile))
+        resp.headers['Content-Type'] = 'application/octet-stream'
+        return resp
+    except:
+        abort(404)
+
 @app.route('/getConfigValue/<name>')
 def getConfigValue(name):
     db = getDB()
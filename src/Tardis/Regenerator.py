@@ -53,9 +53,10 @@ class Regenerator:
         self.tempdir = tempdir
         self.crypt = crypt
 
-    def decryptFile(self, filename, size, authenticate=True):
+    def decryptFile(self, filename, size, authenticate=True, infile=None):
         self.logger.debug("Decrypting %s", filename)
-        infile = self.cacheDir.open(filename, 'rb')
+        if infile is None:
+            infile = self.cacheDir.open(filename, 'rb')
 
         # Get the IV, if it's not specified.
         #infile.seek(0, os.SEEK_SET)
@@ -97,6 +98,28 @@ class Regenerator:
         outfile.seek(0)
         return outfile
 
+    def recoverChunks(self, cksum, authenticate=True):
+        """ Rebuild a file which was stored as a list of content defined chunks """
+        chunks = self.db.getChunkList(cksum)
+        if not chunks:
+            raise RegenerateException("No chunks for {}".format(cksum))
+        self.logger.debug("Rebuilding %s from %d chunks", cksum, len(chunks))
+
+        output = tempfile.TemporaryFile()
+        for chunk in chunks:
+            name = chunk['chunk']
+            infile = self.cacheDir.openChunk(name, 'rb')
+            if chunk['encrypted']:
+                infile = self.decryptFile(name, chunk['disksize'], authenticate, infile=infile)
+            data = infile
+            if chunk['compressed'] is not None and chunk['compressed'].lower() != 'none':
+                data = CompressedBuffer.UncompressedBufferedReader(infile, compressor=chunk['compressed'])
+            shutil.copyfileobj(data, output)
+            infile.close()
+
+        output.seek(0)
+        return output
+
     def recoverChecksum(self, cksum, authenticate=True, chain=None, basisFile=None):
         self.logger.debug("Recovering checksum: %s", cksum)
         cksInfo = None
@@ -121,7 +144,9 @@ class Regenerator:
             if not cksInfo['isfile']:
                 raise RegenerateException("{} is not a file".format(cksum))
 
-            if cksInfo['basis']:
+            if cksInfo['chunked']:
+                return self.recoverChunks(cksum, authenticate)
+            elif cksInfo['basis']:
                 if basisFile:
                     basis = basisFile
                     basis.seek(0)
@@ -344,6 +344,12 @@ class RemoteDB(object):
         r.raise_for_status()
         return r.json()
 
+    @reconnect
+    def getChunkList(self, checksum):
+        r = self.session.get(self.baseURL + "getChunkList/" + checksum, headers=self.headers)
+        r.raise_for_status()
+        return r.json()
+
     @reconnect
     def getChecksumInfoChainByPath(self, name, bset, permchecker=None):
         if not name.startswith('/'):
@@ -503,6 +509,15 @@ class RemoteDB(object):
             temp.seek(0)
             return temp
 
+    @reconnect
+    def openChunk(self, chunk, mode):
+        if mode[0] != 'r':
+            raise PermissionError("Read only file system")
+
+        r = self.session.get(self.baseURL + "getChunkData/" + chunk, stream=True)
+        r.raise_for_status()
+        return r.raw
+
     @reconnect
     def removeOrphans(self):
         r = self.session.get(self.baseURL + "removeOrphans", verify=self.verify, headers=self.headers)
@@ -103,9 +103,10 @@ _backupSetInfoFields = "BackupSet AS backupset, StartTime AS starttime, EndTime
 _backupSetInfoJoin = "FROM Backups LEFT OUTER JOIN Checksums ON Checksums.ChecksumID = Backups.CmdLineId "
 
 _checksumInfoFields = "Checksum AS checksum, ChecksumID AS checksumid, Basis AS basis, Encrypted AS encrypted, " \
-                      "Size AS size, DeltaSize AS deltasize, DiskSize AS disksize, IsFile AS isfile, Compressed AS compressed, ChainLength AS chainlength "
+                      "Size AS size, DeltaSize AS deltasize, DiskSize AS disksize, IsFile AS isfile, Compressed AS compressed, ChainLength AS chainlength, " \
+                      "Chunked AS chunked "
 
-_schemaVersion = 19
+_schemaVersion = 20
 
 def _addFields(x, y):
     """ Add fields to the end of a dict """
@@ -136,6 +137,7 @@ class TardisDB(object):
     db              = None
     currBackupSet   = None
     prevBackupSet   = None
+    prevBackupSession = None
     dirinodes       = {}
     backup          = False
     clientId        = None
@@ -252,6 +254,7 @@ class TardisDB(object):
                 self.prevBackupSet  = f['backupset']
                 self.prevBackupDate = f['starttime']
                 self.lastClientTime = f['clienttime']
+                self.prevBackupSession = f['session']
                 self.prevBackupName = self.prevSet
             #self.cursor.execute = ("SELECT Name, BackupSet FROM Backups WHERE Name = :backup", {"backup": prevSet})
         else:
@@ -260,6 +263,7 @@ class TardisDB(object):
             self.prevBackupSet  = b['backupset']
             self.prevBackupDate = b['starttime']
             self.lastClientTime = b['clienttime']
+            self.prevBackupSession = b['session']
             #self.cursor.execute("SELECT Name, BackupSet FROM Backups WHERE Completed = 1 ORDER BY BackupSet DESC LIMIT 1")
 
         self.clientId = self.getConfigValue('ClientID')
@@ -715,7 +719,7 @@ class TardisDB(object):
             f['nameid'] = self._getNameId(f['name'])
 
     @authenticate
-    def insertChecksum(self, checksum, encrypted=False, size=0, basis=None, deltasize=None, compressed='None', disksize=None, current=True, isFile=True):
+    def insertChecksum(self, checksum, encrypted=False, size=0, basis=None, deltasize=None, compressed='None', disksize=None, current=True, isFile=True, chunked=False):
         self.logger.debug("Inserting checksum file: %s -- %d bytes, Compressed %s", checksum, size, str(compressed))
         added = self._bset(current)
         def _xstr(x):
@@ -729,12 +733,51 @@ class TardisDB(object):
         else:
             chainlength = self.getChainLength(basis) + 1
 
-        self.cursor.execute("INSERT INTO CheckSums (CheckSum,  Size,  Basis,  Encrypted,  DeltaSize,  Compressed,  DiskSize,  ChainLength,  Added,  IsFile) "
-                            "VALUES                (:checksum, :size, :basis, :encrypted, :deltasize, :compressed, :disksize, :chainlength, :added, :isfile)",
+        self.cursor.execute("INSERT INTO CheckSums (CheckSum,  Size,  Basis,  Encrypted,  DeltaSize,  Compressed,  DiskSize,  ChainLength,  Added,  IsFile,  Chunked) "
+                            "VALUES                (:checksum, :size, :basis, :encrypted, :deltasize, :compressed, :disksize, :chainlength, :added, :isfile, :chunked)",
                             {"checksum": checksum, "size": size, "basis": basis, "encrypted": encrypted, "deltasize": deltasize,
-                             "compressed": str(compressed), "disksize": disksize, "chainlength": chainlength, "added": added, "isfile": int(isFile)})
+                             "compressed": str(compressed), "disksize": disksize, "chainlength": chainlength, "added": added, "isfile": int(isFile),
+                             "chunked": int(chunked)})
         return self.cursor.lastrowid
 
+    @authenticate
+    def getChunks(self, chunks):
+        """ Determine which of a list of chunks are already stored.  Returns a set of the known chunks """
+        found = set()
+        chunks = list(chunks)
+        # Keep below SQLite's limit on the number of host parameters
+        for i in range(0, len(chunks), 500):
+            batch = chunks[i:i + 500]
+            c = self._execute("SELECT Chunk FROM Chunks WHERE Chunk IN (" + ",".join("?" * len(batch)) + ")", batch)
+            found.update(row[0] for row in c.fetchall())
+        return found
+
+    @authenticate
+    def insertChunk(self, chunk, size, compressed='None', encrypted=False, disksize=None, current=True):
+        self.logger.debug("Inserting chunk: %s -- %d bytes, Compressed %s", chunk, size, str(compressed))
+        self.cursor.execute("INSERT OR REPLACE INTO Chunks (Chunk, Size, DiskSize, Compressed, Encrypted, Added) "
+                            "VALUES (:chunk, :size, :disksize, :compressed, :encrypted, :added)",
+                            {"chunk": chunk, "size": size, "disksize": disksize, "compressed": str(compressed),
+                             "encrypted": int(encrypted), "added": self._bset(current)})
+        return self.cursor.lastrowid
+
+    @authenticate
+    def setChunkRefs(self, checksum, chunks):
+        """ Record the ordered list of chunks which make up a chunked checksum """
+        ckid = self._executeWithResult("SELECT ChecksumId FROM CheckSums WHERE Checksum = :checksum", {"checksum": checksum})[0]
+        self.cursor.executemany("INSERT INTO ChunkRefs (ChecksumId, Seq, ChunkId) SELECT :checksumid, :seq, ChunkId FROM Chunks WHERE Chunk = :chunk",
+                                ({"checksumid": ckid, "seq": seq, "chunk": chunk} for seq, chunk in enumerate(chunks)))
+
+    @authenticate
+    def getChunkList(self, checksum):
+        """ Get the ordered list of chunks which make up a chunked checksum """
+        c = self._execute("SELECT Chunk AS chunk, Chunks.Size AS size, Chunks.DiskSize AS disksize, Chunks.Compressed AS compressed, Chunks.Encrypted AS encrypted "
+                          "FROM ChunkRefs JOIN Chunks ON ChunkRefs.ChunkId = Chunks.ChunkId "
+                          "JOIN CheckSums ON ChunkRefs.ChecksumId = CheckSums.ChecksumId "
+                          "WHERE CheckSums.Checksum = :checksum ORDER BY Seq ASC",
+                          {"checksum": checksum})
+        return c.fetchall()
+
     @authenticate
     def updateChecksumFile(self, checksum, encrypted=False, size=0, basis=None, deltasize=None, compressed=False, disksize=None, chainlength=0):
         self.logger.debug("Updating checksum file: %s -- %d bytes, Compressed %s", checksum, size, str(compressed))
@@ -856,6 +899,16 @@ class TardisDB(object):
         else:
             return 0
 
+    @authenticate
+    def getSubdirectories(self, dirNode, current=False):
+        (inode, device) = dirNode
+        backupset = self._bset(current)
+        c = self._execute("SELECT Inode, Device FROM Files "
+                          "WHERE Parent = :parent AND ParentDev = :parentDev AND Dir = 1 AND "
+                          ":backup BETWEEN FirstSet AND LastSet",
+                          { "parent": inode, "parentDev": device, "backup": backupset })
+        return [tuple(x) for x in c.fetchall()]
+
     @authenticate
     def readDirectoryForRange(self, dirNode, first, last):
         (inode, device) = dirNode
@@ -1206,9 +1259,26 @@ class TardisDB(object):
             vacuumed = True
         self.conn.execute("UPDATE Backups SET Vacuumed = :vacuumed WHERE BackupSet = :backup", {"backup": self.currBackupSet, "vacuumed": vacuumed})
 
+    @authenticate
+    def listOrphanChunks(self):
+        c = self.conn.execute("SELECT Chunk, DiskSize FROM Chunks "
+                              "WHERE ChunkId NOT IN (SELECT DISTINCT(ChunkId) FROM ChunkRefs)")
+        while True:
+            batch = c.fetchmany(self.chunksize)
+            if not batch:
+                break
+            for row in batch:
+                yield (row[0], row[1])
+
+    @authenticate
+    def deleteChunk(self, chunk):
+        self.cursor.execute("DELETE FROM Chunks WHERE Chunk = :chunk", {"chunk": chunk})
+        return self.cursor.rowcount
+
     @authenticate
     def deleteChecksum(self, checksum):
         self.logger.debug("Deleting checksum: %s", checksum)
+        self.cursor.execute("DELETE FROM ChunkRefs WHERE ChecksumId IN (SELECT ChecksumId FROM Checksums WHERE Checksum = :checksum)", {"checksum": checksum})
         self.cursor.execute("DELETE FROM Checksums WHERE Checksum = :checksum", {"checksum": checksum})
         return self.cursor.rowcount
 
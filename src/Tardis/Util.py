@@ -579,6 +579,18 @@ def removeOrphans(db, cache):
         size   += lSize
 
     db.deleteOrphanChecksums(False)
+
+    # And finally any chunks no longer referenced by a chunked checksum
+    chunks = None
+    for (chunk, disksize) in list(db.listOrphanChunks()):
+        if chunks is None:
+            chunks = cache.chunkStore()
+        logger.debug("Removing chunk %s", chunk)
+        if chunks.remove(chunk):
+            count += 1
+            size += disksize or 0
+        db.deleteChunk(chunk)
+
     return count, size, rounds
 
 # Data transmission functions
@@ -0,0 +1,426 @@
+# vi: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Tardis: A Backup System
+# Copyright 2013-2020, Eric Koldinger, All Rights Reserved.
+# kolding@washington.edu
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import json
+import time
+import errno
+import fcntl
+import select
+import signal
+import struct
+import logging
+import ctypes
+import ctypes.util
+
+# Change journal support.
+#
+# A long running watcher (tardis --watch) puts inotify watches on every directory in the backup, and appends the
+# directories in which something changed to a journal file.  The backup client appends a MARK line with its session
+# when it starts, and a DONE line when it completes.  The next backup, if the watcher has been running continuously
+# since the previous backup started, and nothing was lost, only needs to visit the directories which were
+# written to the journal after the previous backup's MARK, and can have the server clone everything else.
+#
+# Journal lines are a keyword followed by a JSON value:
+#     START time              Watcher started, and all watches are in place
+#     ROOT path               Tree being watched
+#     D path                  Something in this directory changed
+#     T path                  Everything under this directory needs to be looked at (new trees, changed exclude files)
+#     OVERFLOW time           Events were lost
+#     STOP time               Watcher stopped
+#     MARK [session, options] Backup session started
+#     DONE session            Backup session completed
+#
+# The watcher holds a lock on the journal name + '.lock' as long as it runs, so backups can tell if it's alive.
+
+IN_ACCESS        = 0x00000001
+IN_MODIFY        = 0x00000002
+IN_ATTRIB        = 0x00000004
+IN_CLOSE_WRITE   = 0x00000008
+IN_MOVED_FROM    = 0x00000040
+IN_MOVED_TO      = 0x00000080
+IN_CREATE        = 0x00000100
+IN_DELETE        = 0x00000200
+IN_DELETE_SELF   = 0x00000400
+IN_MOVE_SELF     = 0x00000800
+IN_Q_OVERFLOW    = 0x00004000
+IN_IGNORED       = 0x00008000
+IN_ONLYDIR       = 0x01000000
+IN_DONT_FOLLOW   = 0x02000000
+IN_EXCL_UNLINK   = 0x04000000
+IN_ISDIR         = 0x40000000
+IN_CLOEXEC       = 0o2000000
+
+_watchMask = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | \
+             IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+
+_eventHeader = struct.Struct('iIII')
+
+_libc = None
+
+class WatchLimitError(Exception):
+    pass
+
+class Inotify:
+    """ Minimal ctypes wrapper around the Linux inotify calls """
+    def __init__(self):
+        global _libc
+        if _libc is None:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            if not hasattr(_libc, 'inotify_init1'):
+                raise OSError(errno.ENOSYS, "inotify is not supported on this system")
+        self.fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def addWatch(self, path, mask=_watchMask):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                raise WatchLimitError("Out of inotify watches watching {}.  Increase fs.inotify.max_user_watches".format(path))
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def removeWatch(self, wd):
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """ Read a batch of events.  Returns a list of (wd, mask, cookie, name) tuples, empty if timeout expires first """
+        (r, _, _) = select.select([self.fd], [], [], timeout)
+        if not r:
+            return []
+        data = os.read(self.fd, 256 * 1024)
+        events = []
+        pos = 0
+        while pos < len(data):
+            (wd, mask, cookie, length) = _eventHeader.unpack_from(data, pos)
+            pos += _eventHeader.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0')) if length else None
+            pos += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def _line(kind, value):
+    return "{} {}\n".format(kind, json.dumps(value))
+
+def _appendLines(name, lines):
+    """ Append lines to the journal, under lock.  Returns the size of the journal before and after writing """
+    with open(name, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        before = os.fstat(f.fileno()).st_size
+        f.write(''.join(lines))
+        f.flush()
+        after = os.fstat(f.fileno()).st_size
+    return (before, after)
+
+def _parseLine(line):
+    try:
+        (kind, value) = line.rstrip('\n').split(' ', 1)
+        return (kind, json.loads(value))
+    except ValueError:
+        # Probably a partial line, from a crash
+        return (None, None)
+
+def _readLines(f):
+    for line in f:
+        yield _parseLine(line)
+
+class Watcher:
+    """ Watch a set of directory trees, and record the directories where things change in the journal """
+    def __init__(self, roots, journal, crossdev=False, excludeDirs=[], excludeFileName=None, interval=1.0):
+        self.logger = logging.getLogger('Watcher')
+        self.roots = roots
+        self.journal = journal
+        self.crossdev = crossdev
+        self.excludeDirs = set(excludeDirs)
+        self.excludeFileName = excludeFileName
+        self.interval = interval
+
+        self.paths = {}                 # wd -> path
+        self.devices = {}               # root -> device
+        self.dirty = set()
+        self.trees = set()
+        self.written = set()            # Lines written since the last time a backup touched the journal
+        self.journalSize = None
+        self.overflow = False
+        self.running = True
+
+    def addTree(self, top, device):
+        """ Watch every directory under top, on the same device unless crossdev is set """
+        for (dirpath, dirnames, _) in os.walk(top, onerror=lambda e: self.logger.debug("Unable to read %s: %s", e.filename, e)):
+            if dirpath in self.excludeDirs:
+                dirnames[:] = []
+                continue
+            if not self.crossdev:
+                try:
+                    dirnames[:] = [d for d in dirnames if os.lstat(os.path.join(dirpath, d)).st_dev == device]
+                except OSError:
+                    pass
+            try:
+                wd = self.inotify.addWatch(dirpath)
+                self.paths[wd] = dirpath
+            except WatchLimitError:
+                raise
+            except OSError as e:
+                self.logger.debug("Unable to watch %s: %s", dirpath, e)
+
+    def removeTree(self, top):
+        """ Stop watching a tree which has been moved away """
+        prefix = os.path.join(top, '')
+        for (wd, path) in list(self.paths.items()):
+            if path == top or path.startswith(prefix):
+                self.inotify.removeWatch(wd)
+                del self.paths[wd]
+
+    def deviceFor(self, path):
+        for (root, device) in self.devices.items():
+            if path == root or path.startswith(os.path.join(root, '')):
+                return device
+        return None
+
+    def processEvents(self, events):
+        for (wd, mask, cookie, name) in events:
+            if mask & IN_Q_OVERFLOW:
+                self.logger.warning("Inotify queue overflowed.  Next backup will do a full scan")
+                self.overflow = True
+                continue
+            path = self.paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.paths[wd]
+                continue
+
+            if name:
+                # Something changed in this directory
+                self.dirty.add(path)
+                if name == self.excludeFileName:
+                    # Changes the exclusions for everything below here
+                    self.trees.add(path)
+                if mask & IN_ISDIR:
+                    full = os.path.join(path, name)
+                    if mask & IN_MOVED_FROM:
+                        self.removeTree(full)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        self.trees.add(full)
+                        self.addTree(full, self.deviceFor(path))
+            elif mask & (IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF):
+                # Something happened to the directory itself.  It's entry is in the parent.
+                self.dirty.add(os.path.dirname(path))
+
+    def flush(self):
+        with open(self.journal, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # If a backup has written to the journal since we last did, everything needs to be written again after it's mark.
+            if os.fstat(f.fileno()).st_size != self.journalSize:
+                self.written.clear()
+            lines = []
+            if self.overflow:
+                lines.append(_line('OVERFLOW', time.time()))
+                self.overflow = False
+            for (kind, paths) in (('T', self.trees), ('D', self.dirty)):
+                for p in paths:
+                    if (kind, p) not in self.written:
+                        lines.append(_line(kind, p))
+                        self.written.add((kind, p))
+            f.write(''.join(lines))
+            f.flush()
+            self.journalSize = os.fstat(f.fileno()).st_size
+        self.trees.clear()
+        self.dirty.clear()
+
+    def stop(self, signum=None, frame=None):
+        self.running = False
+
+    def run(self):
+        lockFile = open(self.journal + '.lock', 'a')
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.logger.critical("Another watcher is already running on %s", self.journal)
+            return 1
+
+        signal.signal(signal.SIGTERM, self.stop)
+        self.inotify = Inotify()
+        try:
+            for root in self.roots:
+                self.logger.info("Watching %s", root)
+                self.devices[root] = os.lstat(root).st_dev
+                self.addTree(root, self.devices[root])
+            self.logger.info("Watching %d directories", len(self.paths))
+
+            (_, self.journalSize) = _appendLines(self.journal, [_line('START', time.time())] + [_line('ROOT', r) for r in self.roots])
+
+            lastFlush = time.monotonic()
+            while self.running:
+                try:
+                    self.processEvents(self.inotify.read(self.interval))
+                except InterruptedError:
+                    pass
+                now = time.monotonic()
+                if (self.dirty or self.trees or self.overflow) and now - lastFlush >= self.interval:
+                    self.flush()
+                    lastFlush = now
+            return 0
+        except WatchLimitError as e:
+            self.logger.critical(str(e))
+            return 1
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            if self.dirty or self.trees or self.overflow:
+                self.flush()
+            _appendLines(self.journal, [_line('STOP', time.time())])
+            self.inotify.close()
+            lockFile.close()
+
+class ChangeJournal:
+    """ Client side of the change journal.  Determines which directories need to be visited. """
+    def __init__(self, journal):
+        self.logger = logging.getLogger('ChangeJournal')
+        self.journal = journal
+        self.dirty = set()
+        self.trees = set()
+        self.ancestors = set()
+
+    def watcherRunning(self):
+        try:
+            with open(self.journal + '.lock', 'r') as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return False
+        except BlockingIOError:
+            return True
+        except FileNotFoundError:
+            return False
+
+    def mark(self, session, options):
+        _appendLines(self.journal, [_line('MARK', [session, options])])
+
+    def load(self, prevSession, options, directories):
+        """ Load the directories changed since the previous session started.  Returns False if the journal can't be trusted """
+        if not self.watcherRunning():
+            self.logger.info("No watcher running on %s.  Scanning all directories", self.journal)
+            return False
+
+        roots = []
+        found = False
+        done = False
+        dirty = set()
+        trees = set()
+        with open(self.journal, 'r') as f:
+            for (kind, value) in _readLines(f):
+                if kind == 'START':
+                    roots = []
+                    found = done = False
+                elif kind == 'ROOT':
+                    roots.append(value)
+                elif kind == 'MARK':
+                    if value == [prevSession, options]:
+                        found = True
+                        dirty.clear()
+                        trees.clear()
+                elif kind == 'DONE':
+                    if found and value == prevSession:
+                        done = True
+                elif kind in ('OVERFLOW', 'STOP'):
+                    if found:
+                        self.logger.info("Change journal %s: %s since last backup.  Scanning all directories", self.journal, kind)
+                    found = done = False
+                elif found:
+                    if kind == 'D':
+                        dirty.add(value)
+                    elif kind == 'T':
+                        trees.add(value)
+
+        if not (found and done):
+            self.logger.info("Change journal %s does not cover the previous backup.  Scanning all directories", self.journal)
+            return False
+
+        for d in directories:
+            if not any(d == r or d.startswith(os.path.join(r, '')) for r in roots):
+                self.logger.info("%s not watched.  Scanning all directories", d)
+                return False
+
+        self.dirty = dirty
+        self.trees = trees
+        for p in dirty.union(trees):
+            parent = os.path.dirname(p)
+            while parent not in self.ancestors and parent != p:
+                self.ancestors.add(parent)
+                (p, parent) = (parent, os.path.dirname(parent))
+        self.logger.debug("Change journal: %d changed directories, %d changed trees", len(dirty), len(trees))
+        return True
+
+    def isChangedTree(self, path):
+        return path in self.trees
+
+    def wanted(self, path):
+        return path in self.dirty or path in self.trees or path in self.ancestors
+
+    def split(self, dirs):
+        """ Split a list of directories into those which need to be visited, and those which are unchanged """
+        visit = []
+        skip = []
+        for d in dirs:
+            (visit if self.wanted(d) else skip).append(d)
+        return (visit, skip)
+
+    def done(self, session):
+        """ Mark the session complete, and trim out everything that the next backup won't need """
+        with open(self.journal, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            lines = f.readlines()
+            lines.append(_line('DONE', session))
+
+            # Keep the header of the current watcher run, and everything from this session's mark on.
+            header = []
+            start = 0
+            for (i, (kind, value)) in enumerate(_parseLine(l) for l in lines):
+                if kind == 'START':
+                    header = [lines[i]]
+                    start = i + 1
+                elif kind == 'ROOT' and start == i:
+                    header.append(lines[i])
+                    start = i + 1
+                elif kind == 'MARK' and value[0] == session:
+                    start = i
+            f.seek(0)
+            f.truncate()
+            f.write(''.join(header + lines[start:]))
+
+def watch(roots, journal, crossdev=False, excludeDirs=[], excludeFileName=None):
+    watcher = Watcher(roots, journal, crossdev, excludeDirs, excludeFileName)
+    return watcher.run()
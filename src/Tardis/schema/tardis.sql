@@ -54,9 +54,29 @@ CREATE TABLE IF NOT EXISTS CheckSums (
     ChainLength INTEGER,
     Added       INTEGER,            -- References BackupSet, but not foreign key, as sets can be deleted.
     IsFile      INTEGER,            -- Boolean, is there a file backing this checksum
+    Chunked     INTEGER DEFAULT 0,  -- Boolean, file is stored as a list of chunks in ChunkRefs
     FOREIGN KEY(Basis) REFERENCES CheckSums(Checksum)
 );
 
+CREATE TABLE IF NOT EXISTS Chunks (
+    Chunk       TEXT UNIQUE NOT NULL,
+    ChunkId     INTEGER PRIMARY KEY AUTOINCREMENT,
+    Size        INTEGER,
+    DiskSize    INTEGER,
+    Compressed  TEXT,
+    Encrypted   INTEGER,            -- Boolean
+    Added       INTEGER             -- References BackupSet, but not foreign key, as sets can be deleted.
+);
+
+CREATE TABLE IF NOT EXISTS ChunkRefs (
+    ChecksumId  INTEGER NOT NULL,
+    Seq         INTEGER NOT NULL,
+    ChunkId     INTEGER NOT NULL,
+    PRIMARY KEY(ChecksumId, Seq),
+    FOREIGN KEY(ChecksumId)  REFERENCES CheckSums(ChecksumId),
+    FOREIGN KEY(ChunkId)     REFERENCES Chunks(ChunkId)
+);
+
 CREATE TABLE IF NOT EXISTS Names (
     Name        TEXT UNIQUE NOT NULL,
     NameId      INTEGER PRIMARY KEY AUTOINCREMENT
@@ -100,6 +120,7 @@ CREATE TABLE IF NOT EXISTS Tags (
 );
 
 CREATE INDEX IF NOT EXISTS CheckSumIndex ON CheckSums(Checksum);
+CREATE INDEX IF NOT EXISTS ChunkRefIndex ON ChunkRefs(ChunkId);
 
 CREATE INDEX IF NOT EXISTS InodeFirstIndex ON Files(Inode ASC, Device ASC, FirstSet ASC);
 CREATE INDEX IF NOT EXISTS ParentFirstIndex ON Files(Parent ASC, ParentDev ASC, FirstSet ASC);
@@ -117,5 +138,5 @@ CREATE VIEW IF NOT EXISTS VFiles AS
     JOIN Backups ON Backups.BackupSet BETWEEN Files.FirstSet AND Files.LastSet
     LEFT OUTER JOIN CheckSums ON Files.ChecksumId = CheckSums.ChecksumId;
 
-INSERT OR REPLACE INTO Config (Key, Value) VALUES ("SchemaVersion", "19");
+INSERT OR REPLACE INTO Config (Key, Value) VALUES ("SchemaVersion", "20");
 INSERT OR REPLACE INTO Config (Key, Value) VALUES ("VacuumInterval", "5");
@@ -0,0 +1,116 @@
+#! /usr/bin/env python3
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Tardis: A Backup System
+# Copyright 2013-2020, Eric Koldinger, All Rights Reserved.
+# kolding@washington.edu
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the copyright holder nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# Measure the memory used per file tracked by the client, while waiting on the server:
+# the inode DB entry, and the packed file info kept for pending clones.
+# Compares against the original dict based implementation.
+
+import sys
+import argparse
+import tracemalloc
+import gc
+from collections import defaultdict
+
+from Tardis import Client
+
+class LegacyInodeEntry:
+    def __init__(self):
+        self.paths = []
+        self.numEntries = 0
+        self.finfo = None
+
+class LegacyInodeDB:
+    def __init__(self):
+        self.db = defaultdict(LegacyInodeEntry)
+
+    def insert(self, inode, finfo, path):
+        entry = self.db[inode]
+        entry.numEntries += 1
+        entry.paths.append(path)
+        entry.finfo = finfo
+
+def mkFileInfo(i, dirname):
+    # Roughly what Client.mkFileInfo generates
+    name = "file-{:08d}.dat".format(i)
+    return {
+        'name':   name,
+        'inode':  1000000 + i,
+        'dir':    False,
+        'link':   False,
+        'nlinks': 1,
+        'size':   4096 + i,
+        'mtime':  1600000000 + i,
+        'ctime':  1600000000 + i,
+        'atime':  1600000000 + i,
+        'mode':   0o100644,
+        'uid':    1000,
+        'gid':    1000,
+        'dev':    2049
+    }, dirname + '/' + name
+
+def measure(numFiles, perDir, legacy):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    db = LegacyInodeDB() if legacy else Client.InodeDB()
+    clones = {}
+    for d in range(0, numFiles, perDir):
+        dirname = "/home/someuser/some/fairly/typical/path/dir-{:06d}".format(d // perDir)
+        files = []
+        for i in range(d, min(d + perDir, numFiles)):
+            (finfo, path) = mkFileInfo(i, dirname)
+            db.insert((finfo['inode'], finfo['dev']), finfo, path)
+            files.append(finfo)
+        # And keep it around as a clone.
+        clones[(d, 2049)] = (dirname, files if legacy else Client.PackedFiles(files))
+
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure client memory use per pending file')
+    parser.add_argument('--files', '-n', type=int, default=200000,   help='Number of files to track.  Default: %(default)s')
+    parser.add_argument('--perdir', type=int, default=100,          help='Files per directory.  Default: %(default)s')
+    args = parser.parse_args()
+
+    legacy = measure(args.files, args.perdir, True)
+    compact = measure(args.files, args.perdir, False)
+
+    print("Files:   {:,}".format(args.files))
+    print("Legacy:  {:8.1f} bytes/file".format(legacy / args.files))
+    print("Compact: {:8.1f} bytes/file".format(compact / args.files))
+    print("Savings: {:8.1f}%".format(100.0 * (legacy - compact) / legacy))
+
+if __name__ == "__main__":
+    sys.exit(main())